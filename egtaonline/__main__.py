@@ -2,16 +2,138 @@
 import argparse
 import asyncio
 import contextlib
+import csv
+import io
 import itertools
 import json
 import logging
+import os
 import sys
+import time
 
 import requests
 
 import egtaonline
 from egtaonline import api
 from egtaonline import auth
+from egtaonline import mirror
+
+
+def _dumps(obj):
+    """Encode json as bytes"""
+    return json.dumps(obj).encode('utf8')
+
+
+class _Output(object): # pylint: disable=too-many-instance-attributes
+    """Buffered writer of records to a text stream
+
+    Encoded records are collected and written to the stream's underlying
+    binary buffer in large chunks. Records are written as newline delimited
+    json, a json list, or a table where nested values are encoded as json.
+    """
+    def __init__(self, stream, fmt='ndjson', buffer_size=1 << 16):
+        self._stream = stream
+        self._binary = getattr(stream, 'buffer', None)
+        self._fmt = fmt
+        self._buffer_size = buffer_size
+        self._chunks = []
+        self._size = 0
+        self._text = io.StringIO()
+        self._csv = csv.writer(
+            self._text, delimiter='\t' if fmt == 'tsv' else ',',
+            lineterminator='\n')
+        self._fields = None
+        self._stream_started = False
+        self._count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, value, traceback):
+        try:
+            self.close()
+        except BrokenPipeError: # pragma: no cover
+            typ = BrokenPipeError
+        broken = typ is not None and issubclass(typ, BrokenPipeError)
+        if broken: # pragma: no cover
+            # Don't care if stream breaks, but python flushes stdout on exit,
+            # which would raise again
+            with contextlib.suppress(OSError):
+                os.dup2(os.open(os.devnull, os.O_WRONLY),
+                        self._stream.fileno())
+            return True
+        return False
+
+    def _add(self, data):
+        """Add encoded data, flushing if the buffer is full"""
+        self._chunks.append(data)
+        self._size += len(data)
+        if self._size >= self._buffer_size:
+            self.flush()
+
+    def _row(self, record):
+        """Add a table row"""
+        if self._fields is None:
+            self._fields = list(record)
+            self._csv.writerow(self._fields)
+        self._csv.writerow([_cell(record.get(field))
+                            for field in self._fields])
+        self._add(self._text.getvalue().encode('utf8'))
+        self._text.seek(0)
+        self._text.truncate()
+
+    def begin(self):
+        """Start a stream of records
+
+        This makes sure that empty streams are still output as a json list.
+        """
+        self._stream_started = True
+
+    def write(self, record):
+        """Write one record of a stream"""
+        self._stream_started = True
+        if self._fmt == 'ndjson':
+            self._add(_dumps(record) + b'\n')
+        elif self._fmt == 'json':
+            self._add((b',\n' if self._count else b'[') + _dumps(record))
+        else:
+            self._row(record)
+        self._count += 1
+
+    def write_one(self, record):
+        """Write the only record of a command"""
+        if self._fmt in {'ndjson', 'json'}:
+            self._add(_dumps(record) + b'\n')
+        else:
+            self._row(record)
+
+    def flush(self):
+        """Write buffered data to the stream"""
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self._size = 0
+        if self._binary is None:
+            self._stream.write(data.decode('utf8'))
+        else:
+            self._stream.flush()
+            self._binary.write(data)
+            self._binary.flush()
+
+    def close(self):
+        """Finish writing and flush the stream"""
+        if self._fmt == 'json' and self._stream_started:
+            self._add(b']\n' if self._count else b'[]\n')
+        self.flush()
+
+
+def _cell(value):
+    """Convert a value to a table cell"""
+    if value is None:
+        return ''
+    elif isinstance(value, (dict, list)):
+        return json.dumps(value)
+    else:
+        return value
 
 
 async def amain(*argv): # pylint: disable=too-many-statements
@@ -25,6 +147,20 @@ async def amain(*argv): # pylint: disable=too-many-statements
     parser.add_argument(
         '--version', '-V', action='version',
         version='%(prog)s {}'.format(egtaonline.__version__))
+    parser.add_argument(
+        '--format', choices=('ndjson', 'json', 'csv', 'tsv'),
+        default='ndjson', help="""The format of output records. `ndjson` puts
+        each record on its own line, `json` outputs a list of records, and
+        `csv` and `tsv` output a table with a header where nested values are
+        encoded as json. Commands that output a single record output it on its
+        own for `json`. (default: %(default)s)""")
+
+    parser.add_argument(
+        '--job-index', metavar='<database>', help="""A sqlite database file to
+        keep an index of job ids to folders in. Folders are added as
+        simulations are fetched, and make looking up simulations by job id
+        faster in later commands. It can be the same file as a simulation
+        mirror.""")
 
     parser_auth = parser.add_mutually_exclusive_group()
     parser_auth.add_argument(
@@ -151,11 +287,33 @@ async def amain(*argv): # pylint: disable=too-many-statements
         scheduler via its string name not its id number. This is much slower
         than accessing via id number, and only works for generic
         schedulers.""")
+    parser_sched.add_argument(
+        '--concurrency', '-c', metavar='<concurrency>', type=int, default=8,
+        help="""The maximum number of scheduler requirements to fetch at once
+        when checking if schedulers are running. (default: %(default)d)""")
+    parser_sched.add_argument(
+        '--cache', metavar='<database>', help="""A sqlite database file to
+        cache scheduler requirements in when checking if schedulers are
+        running, so that repeated checks within `--ttl` seconds don't fetch
+        them again. It can be the same file as a simulation mirror.""")
+    parser_sched.add_argument(
+        '--ttl', metavar='<seconds>', type=float, default=30, help="""The
+        number of seconds cached requirements are used for.  (default:
+        %(default)g)""")
+    parser_sched.add_argument(
+        '--interval', '-i', metavar='<seconds>', type=float, default=60,
+        help="""The number of seconds between polls when streaming progress.
+        (default: %(default)g)""")
     parser_act = (parser_sched.add_argument_group('scheduler action')
                   .add_mutually_exclusive_group())
     parser_act.add_argument(
         '--requirements', '-r', action='store_true', help="""Get scheuler
         requirements instead of just information.""")
+    parser_act.add_argument(
+        '--progress', action='store_true', help="""Stream the progress of the
+        scheduler until it completes. Each line has the observations completed
+        and required, the smoothed throughput in observations per second, and
+        the estimated seconds until it completes.""")
     parser_act.add_argument(
         '--deactivate', action='store_true', help="""Deactivate the specified
         scheduler.""")
@@ -172,18 +330,28 @@ async def amain(*argv): # pylint: disable=too-many-statements
         is specified, each simulation comes out on a different line, and can be
         easily filtered with `head` and `jq`.""")
     parser_sims.add_argument(
-        'folder', metavar='folder-id', nargs='?', type=int, help="""Get
-        information from a specific simulation instead of all of them. This
-        should be the folder number of the simulation of interest.""")
+        'folder', metavar='folder-id', nargs='*', type=int, help="""Get
+        information from specific simulations instead of all of them. These
+        should be the folder numbers of the simulations of interest. If more
+        than one is specified, they're fetched concurrently and each comes out
+        on its own line as it's fetched.""")
+    parser_sims.add_argument(
+        '-j', '--job', action='store_true', help="""Fetch the simulations with
+        given PBS job ids instead of their folder numbers.""")
     parser_sims.add_argument(
-        '-j', '--job', action='store_true', help="""Fetch the simulation with a
-        given PBS job id instead of its folder number.""")
+        '--concurrency', '-c', metavar='<concurrency>', type=int, default=8,
+        help="""The maximum number of simulations to fetch at once when
+        several are specified. (default: %(default)d)""")
     parser_sims.add_argument(
         '--page', '-p', metavar='<start-page>', default=1, type=int, help="""The
         page to start scanning at. (default: %(default)d)""")
     parser_sims.add_argument(
         '--ascending', '-a', action='store_true', help="""Return results in
         ascending order instead of descending.""")
+    parser_sims.add_argument(
+        '--prefetch', metavar='<pages>', default=2, type=int, help="""The
+        number of pages to request ahead of the page being output when
+        streaming simulations. (default: %(default)d)""")
     parser_sims.add_argument(
         '--sort-column', '-s', choices=('job', 'folder', 'profile', 'state'),
         default='job', help="""Column to order results by.  (default:
@@ -205,6 +373,44 @@ async def amain(*argv): # pylint: disable=too-many-statements
         simulations where the simulator fullname contains the supplied
         substring.""")
 
+    parser_mirror = subparsers.add_parser(
+        'mirror', help="""Sync or query a local mirror of simulations.""",
+        description="""Maintain a local sqlite mirror of EGTA Online
+        simulations. By default this syncs the mirror and outputs the number of
+        simulations that were added, updated, and refreshed. Syncing only
+        scans simulations until it reaches ones that are already mirrored, and
+        then refreshes any that haven't finished. With `--query` the mirror is
+        queried locally instead, outputting each simulation on its own
+        line.""")
+    parser_mirror.add_argument(
+        'database', metavar='<database>', help="""The sqlite database file of
+        the mirror. It's created if it doesn't exist.""")
+    parser_mirror.add_argument(
+        '--concurrency', '-c', metavar='<concurrency>', type=int, default=8,
+        help="""The maximum number of unfinished simulations to refresh at
+        once. (default: %(default)d)""")
+    parser_mirror_query = parser_mirror.add_argument_group('query')
+    parser_mirror_query.add_argument(
+        '--query', '-q', action='store_true', help="""Query the mirror instead
+        of syncing it. This doesn't connect to egta online.""")
+    parser_mirror_query.add_argument(
+        '--state',
+        choices=['canceled', 'complete', 'failed', 'pending', 'processing',
+                 'queued', 'running'],
+        help="""Only select simulations with a specific state.""")
+    parser_mirror_query.add_argument(
+        '--simulator', metavar='<sim-fullname>', help="""Only select
+        simulations of the simulator with this full name.""")
+    parser_mirror_query.add_argument(
+        '--profile', metavar='<profile-substring>', help="""Only select
+        simulations whose profiles contain the supplied substring.""")
+    parser_mirror_query.add_argument(
+        '--since', metavar='<seconds>', type=float, help="""Only select
+        simulations that were first mirrored in the last `seconds`.""")
+    parser_mirror_query.add_argument(
+        '--limit', '-l', metavar='<limit>', type=int, help="""The maximum
+        number of simulations to select.""")
+
     parser_login = subparsers.add_parser(
         'login', help="""Login to egtaonline by fetching your auth token.""",
         description="""Download an authtoken to allow requests to
@@ -226,28 +432,38 @@ async def amain(*argv): # pylint: disable=too-many-statements
     logging.basicConfig(stream=sys.stderr,
                         level=30 - 10 * min(args.verbose, 2))
 
-    async with api.api(args.auth_string) as eoapi:
-        if args.command == 'sim':
-            return await _sim(eoapi, args)
-        elif args.command == 'game':
-            return await _game(eoapi, args)
-        elif args.command == 'sched':
-            return await _sched(eoapi, args)
-        elif args.command == 'sims':
-            return await _sims(eoapi, args)
-        else:
-            assert False  # pragma: no cover
+    if args.command == 'mirror' and args.query:
+        with _Output(sys.stdout, args.format) as out:
+            return _mirror_query(args, out)
+
+    with contextlib.ExitStack() as stack:
+        job_index = None if args.job_index is None else stack.enter_context(
+            mirror.JobIndex(args.job_index))
+        async with api.api(args.auth_string, job_index=job_index) as eoapi:
+            with _Output(sys.stdout, args.format) as out:
+                if args.command == 'sim':
+                    return await _sim(eoapi, args, out)
+                elif args.command == 'game':
+                    return await _game(eoapi, args, out)
+                elif args.command == 'sched':
+                    return await _sched(eoapi, args, out)
+                elif args.command == 'sims':
+                    return await _sims(eoapi, args, out)
+                elif args.command == 'mirror':
+                    return await _mirror(eoapi, args, out)
+                else:
+                    assert False  # pragma: no cover
 
 
-async def _sim(eoapi, args): # pylint: disable=too-many-branches
+async def _sim(eoapi, args, out): # pylint: disable=too-many-branches
     """Do stuff with simulators"""
     if args.sim_id is None:  # Get all simulators
         sims = await eoapi.get_simulators()
+        out.begin()
         try:
             for sim in sims:
-                json.dump(sim, sys.stdout)
-                sys.stdout.write('\n')
-        except (BrokenPipeError, KeyboardInterrupt):  # pragma: no cover
+                out.write(sim)
+        except KeyboardInterrupt:  # pragma: no cover
             pass  # Don't care if stream breaks or is killed
 
     else:  # Operate on a single simulator
@@ -286,19 +502,18 @@ async def _sim(eoapi, args): # pylint: disable=too-many-branches
                     await sim.add_role(args.role)
 
         else:  # Return information instead
-            json.dump(await sim.get_info(), sys.stdout)
-            sys.stdout.write('\n')
+            out.write_one(await sim.get_info())
 
 
-async def _game(eoapi, args): # pylint: disable=too-many-statements,too-many-branches
+async def _game(eoapi, args, out): # pylint: disable=too-many-statements,too-many-branches
     """Do stuff with games"""
     if args.game_id is None:  # Get all games
         games = await eoapi.get_games()
+        out.begin()
         try:
             for game in games:
-                json.dump(game, sys.stdout)
-                sys.stdout.write('\n')
-        except (BrokenPipeError, KeyboardInterrupt):  # pragma: no cover
+                out.write(game)
+        except KeyboardInterrupt:  # pragma: no cover
             pass  # Don't care if stream breaks or is killed
 
     elif args.fetch_conf:  # fetch game data
@@ -322,8 +537,7 @@ async def _game(eoapi, args): # pylint: disable=too-many-statements,too-many-bra
             dump = await game.get_full_data()
         else:
             dump = await game.get_structure()
-        json.dump(dump, sys.stdout)
-        sys.stdout.write('\n')
+        out.write_one(dump)
 
     else:  # Operate on specific game
         # Get game
@@ -365,31 +579,21 @@ async def _game(eoapi, args): # pylint: disable=too-many-statements,too-many-bra
                 dump = await game.get_full_data()
             else:
                 dump = await game.get_structure()
-            json.dump(dump, sys.stdout)
-            sys.stdout.write('\n')
+            out.write_one(dump)
 
 
-async def _sched(eoapi, args):
+async def _sched(eoapi, args, out):
     """Do stuff with schedulers"""
     if args.sched_id is None:  # Get all schedulers
         scheds = await eoapi.get_generic_schedulers()
+        out.begin()
         try:
             if args.running:
-                async def print_running(sched):
-                    """Print a scheduler if it's running"""
-                    reqs = await sched.get_requirements()
-                    if any(r['current_count'] < r['requirement'] for r
-                           in reqs['scheduling_requirements']):
-                        json.dump(sched, sys.stdout)
-                        sys.stdout.write('\n')
-
-                await asyncio.gather(*[
-                    print_running(s) for s in scheds if s['active']])
+                await _sched_running(eoapi, args, out, scheds)
             else:
                 for sched in scheds:
-                    json.dump(sched, sys.stdout)
-                    sys.stdout.write('\n')
-        except (BrokenPipeError, KeyboardInterrupt):  # pragma: no cover
+                    out.write(sched)
+        except KeyboardInterrupt:  # pragma: no cover
             pass  # Don't care if stream breaks or is killed
 
     else:  # Get a single scheduler
@@ -405,32 +609,65 @@ async def _sched(eoapi, args):
         elif args.delete:
             await sched.destroy_scheduler()
         elif args.requirements:
-            json.dump(await sched.get_requirements(), sys.stdout)
-            sys.stdout.write('\n')
+            out.write_one(await sched.get_requirements())
+        elif args.progress:
+            out.begin()
+            progress = sched.get_progress(args.interval)
+            try:
+                async for prog in progress:
+                    out.write(prog)
+                    out.flush()
+            except KeyboardInterrupt:  # pragma: no cover
+                pass  # Don't care if stream breaks or is killed
+            finally:
+                await progress.aclose()
         else:
-            json.dump(await sched.get_info(), sys.stdout)
-            sys.stdout.write('\n')
+            out.write_one(await sched.get_info())
 
 
-async def _sims(eoapi, args):
+async def _sched_running(eoapi, args, out, scheds):
+    """Output the schedulers that are running as they're found"""
+    active = {sched['id']: sched for sched in scheds if sched['active']}
+    with contextlib.ExitStack() as stack:
+        cache = None if args.cache is None else stack.enter_context(
+            mirror.RequirementsCache(args.cache, args.ttl))
+        reqs_all = eoapi.get_requirements_all(
+            active.values(), args.concurrency, cache)
+        try:
+            async for reqs in reqs_all:
+                if any(r['current_count'] < r['requirement'] for r
+                       in reqs['scheduling_requirements']):
+                    out.write(active[reqs['id']])
+                    out.flush()
+        finally:
+            await reqs_all.aclose()
+        if cache is not None:
+            cache.expire()
+
+
+async def _sims(eoapi, args, out): # pylint: disable=too-many-branches
     """Do stuff with simulations"""
-    if args.folder is not None:  # Get info on one simulation
+    if len(args.folder) == 1:  # Get info on one simulation
         if args.job:
-            itr = eoapi.get_simulations(search='job="{:d}"'.format(args.folder))
-            try:
-                sim = await itr.__anext__()
-            except StopAsyncIteration:
-                raise ValueError('No simulation with job id {:d}'.format(
-                    args.folder))
-            with contextlib.suppress(StopAsyncIteration):
-                await itr.__anext__()
-                raise ValueError((
-                    'Somehow there were multiple simulations with the same '
-                    'job id {:d}').format(args.folder))
+            sim = await eoapi.get_simulation_job(args.folder[0])
         else:
-            sim = await eoapi.get_simulation(args.folder)
-        json.dump(sim, sys.stdout)
-        sys.stdout.write('\n')
+            sim = await eoapi.get_simulation(args.folder[0])
+        out.write_one(sim)
+
+    elif args.folder:  # Get info on several simulations
+        out.begin()
+        if args.job:
+            for job in args.folder:
+                out.write(await eoapi.get_simulation_job(job))
+            return
+        sims = eoapi.get_simulations_detail(args.folder, args.concurrency)
+        try:
+            async for sim in sims:
+                out.write(sim)
+        except KeyboardInterrupt:  # pragma: no cover
+            pass  # Don't care if stream breaks or is killed
+        finally:
+            await sims.aclose()
 
     else:  # Stream simulations
         search = ' '.join(itertools.chain(
@@ -438,14 +675,35 @@ async def _sims(eoapi, args):
                 ('state', args.state), ('simulator', args.simulator),
                 ('profile', args.profile)] if val is not None],
             [args.search]))
+        out.begin()
+        sims = eoapi.get_simulations(
+            page_start=args.page, asc=args.ascending,
+            column=args.sort_column, search=search, prefetch=args.prefetch)
         try:
-            async for sim in eoapi.get_simulations(
-                    page_start=args.page, asc=args.ascending,
-                    column=args.sort_column, search=search):
-                json.dump(sim, sys.stdout)
-                sys.stdout.write('\n')
-        except (BrokenPipeError, KeyboardInterrupt):  # pragma: no cover
+            async for sim in sims:
+                out.write(sim)
+        except KeyboardInterrupt:  # pragma: no cover
             pass  # Don't care if stream breaks or is killed
+        finally:
+            await sims.aclose()
+
+
+async def _mirror(eoapi, args, out):
+    """Sync a mirror"""
+    with mirror.Mirror(args.database) as mirr:
+        out.write_one(await mirr.sync(eoapi, args.concurrency))
+
+
+def _mirror_query(args, out):
+    """Query a mirror"""
+    since = None if args.since is None else time.time() - args.since
+    with mirror.Mirror(args.database) as mirr:
+        sims = mirr.query(
+            state=args.state, simulator=args.simulator, profile=args.profile,
+            since=since, limit=args.limit)
+    out.begin()
+    for sim in sims:
+        out.write(sim)
 
 
 def main():  # pragma: no cover
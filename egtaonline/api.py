@@ -53,22 +53,25 @@ class _EgtaOnlineSession(object): # pylint: disable=too-many-instance-attributes
     This object is private to hide private request methods."""
     def __init__( # pylint: disable=too-many-arguments
             self, auth_token, domain, retry_on, num_tries, retry_delay,
-            retry_backoff, executor):
+            retry_backoff, executor, session_factory, job_index):
         self.domain = domain
         self.auth_token = auth_token
+        self.job_index = {} if job_index is None else job_index
+        self.waiter = _SchedulerWaiter(self)
 
         self._retry_on = frozenset(retry_on)
         self._num_tries = num_tries
         self._retry_delay = retry_delay
         self._retry_backoff = retry_backoff
         self._executor = executor
+        self._session_factory = session_factory
         self._loop = asyncio.get_event_loop()
         self._session = None
 
     async def aopen(self):
         """Open the requester"""
         assert self._session is None
-        self._session = requests.Session()
+        self._session = self._session_factory()
         # This authenticates us for the duration of the session
         resp = self._session.get(
             'https://{domain}'.format(domain=self.domain),
@@ -80,12 +83,16 @@ class _EgtaOnlineSession(object): # pylint: disable=too-many-instance-attributes
 
     async def aclose(self):
         """Close the requester"""
+        self.waiter.close()
         if self._session is not None:  # pragma: no branch
             self._session.close()
             self._session = None
 
-    async def retry_request(self, verb, url, data):
-        """Make a request, retying if it fails"""
+    async def retry_request(self, verb, url, data, stream=False):
+        """Make a request, retying if it fails
+
+        If `stream`, the body isn't read until the response's content is
+        accessed, and the caller should close the response."""
         data = _encode_data(data)
         response = None
         timeout = self._retry_delay
@@ -94,11 +101,18 @@ class _EgtaOnlineSession(object): # pylint: disable=too-many-instance-attributes
             try:
                 response = await self._loop.run_in_executor(
                     self._executor, functools.partial(
-                        self._session.request, verb, url, data=data))
+                        self._session.request, verb, url, data=data,
+                        stream=stream))
                 if response.status_code not in self._retry_on:
+                    if stream and not response.ok:
+                        response.close()
                     response.raise_for_status()
-                    logging.debug('response "%s"', response.text)
+                    # Only decode the response if it's actually logged
+                    if not stream and logging.getLogger().isEnabledFor(
+                            logging.DEBUG):
+                        logging.debug('response "%s"', response.text)
                     return response
+                response.close()
                 logging.debug(
                     '%s request to %s with data %s failed with status'
                     '%d, retrying in %.0f seconds', verb, url, data,
@@ -140,11 +154,11 @@ class _EgtaOnlineSession(object): # pylint: disable=too-many-instance-attributes
                 sleep *= self._retry_backoff
         raise exception
 
-    async def non_api_request(self, verb, endpoint, data=None):
+    async def non_api_request(self, verb, endpoint, data=None, stream=False):
         """Make a standard request instead of hitting the api"""
         url = 'https://{domain}/{endpoint}'.format(
             domain=self.domain, endpoint=endpoint)
-        return await self.retry_request(verb, url, data or {})
+        return await self.retry_request(verb, url, data or {}, stream)
 
     async def json_non_api_request(
             self, schema, verb, endpoint, data=None):
@@ -171,6 +185,17 @@ class _EgtaOnlineSession(object): # pylint: disable=too-many-instance-attributes
         resp = await self.non_api_request(verb, endpoint, data)
         return etree.HTML(resp.text)
 
+    async def html_rows_request(self, verb, endpoint, rows, data=None):
+        """non api request for rows of html text
+
+        `rows` is a `_RowExtractor`. The response is streamed and its bytes
+        are fed to it in the executor without building a tree, and the rest
+        is read without being parsed once it's done."""
+        resp = await self.non_api_request(verb, endpoint, data, True)
+        with resp:
+            return await self._loop.run_in_executor(
+                self._executor, _feed_rows, resp, rows)
+
     # The following methods are used by several "objects" and so they are in
     # session object for easy access
 
@@ -280,11 +305,12 @@ class _EgtaOnlineApi(object):
     def __init__( # pylint: disable=too-many-arguments
             self, auth_token=None, domain='egtaonline.eecs.umich.edu',
             retry_on=(504,), num_tries=20, retry_delay=20, retry_backoff=1.2,
-            executor=None):
+            executor=None, session_factory=requests.Session, job_index=None):
         self.domain = domain
         self._sess = _EgtaOnlineSession(
             auth_token, domain, retry_on, num_tries, retry_delay,
-            retry_backoff, executor)
+            retry_backoff, executor, session_factory, job_index)
+        self._watcher = _SimulationWatcher(self)
 
     async def aopen(self):
         """Open the api"""
@@ -296,6 +322,7 @@ class _EgtaOnlineApi(object):
 
     async def aclose(self):
         """Close the api"""
+        self._watcher.close()
         await self._sess.aclose()
 
     async def __aenter__(self):
@@ -329,6 +356,69 @@ class _EgtaOnlineApi(object):
         """Get a scheduler with an id"""
         return await _Scheduler(self._sess, id=sched_id).get_info()
 
+    def get_requirements_all(self, schedulers, concurrency=8, cache=None):
+        """Get the requirements of several schedulers
+
+        Parameters
+        ----------
+        schedulers : [Scheduler]
+            The schedulers to get requirements for.
+        concurrency : int, optional
+            The maximum number of requirements to fetch at once.
+        cache : {int: dict}, optional
+            A mutable mapping of scheduler ids to requirements. Requirements
+            in the cache are returned instead of being fetched, and fetched
+            requirements are added to it. A mapping that expires entries, like
+            `mirror.RequirementsCache`, bounds how stale they can be.
+
+        Returns
+        -------
+        requirements : AsyncIterator
+            An iterator of the requirements of each scheduler, as returned by
+            `get_requirements` even when they come from the cache, in the
+            order that they're fetched. Iterators
+            that aren't exhausted should be closed with `aclose` to cancel
+            pending requests.
+        """
+        assert concurrency > 0, 'concurrency must be positive'
+        limit = asyncio.Semaphore(concurrency)
+
+        async def get_requirements(sched):
+            """Get the requirements of one scheduler"""
+            cached = None if cache is None else cache.get(sched['id'])
+            if cached is not None:
+                reqs = _Scheduler(self._sess, cached)
+                reqs['scheduling_requirements'] = [
+                    _Profile(self._sess, prof)
+                    for prof in cached['scheduling_requirements']]
+                return reqs
+            async with limit:
+                reqs = await sched.get_requirements()
+            if cache is not None:
+                cache[sched['id']] = reqs
+            return reqs
+
+        return _CompletedIterator(
+            [get_requirements(sched) for sched in schedulers])
+
+    def wait_all( # pylint: disable=too-many-arguments
+            self, schedulers, min_interval=5, max_interval=300,
+            concurrency=8):
+        """Wait for schedulers to complete
+
+        Parameters are the same as `Scheduler.wait_complete`.
+
+        Returns
+        -------
+        schedulers : AsyncIterator
+            An iterator of the requirements of each scheduler in the order
+            that they complete. Iterators that aren't exhausted should be
+            closed with `aclose` to stop waiting.
+        """
+        return _CompletedIterator([
+            sched.wait_complete(min_interval, max_interval, concurrency)
+            for sched in schedulers])
+
     async def get_scheduler_name(self, name):
         """Get a scheduler from its names"""
         for sched in await self.get_generic_schedulers():
@@ -435,7 +525,9 @@ class _EgtaOnlineApi(object):
         profile to a scheduler, or from a game with sufficient granularity."""
         return await _Profile(self._sess, id=prof_id).get_structure()
 
-    def get_simulations(self, page_start=1, asc=False, column=None, search=''):
+    def get_simulations( # pylint: disable=too-many-arguments
+            self, page_start=1, asc=False, column=None, search='',
+            prefetch=0, cursor=None):
         """Get information about current simulations
 
         Parameters
@@ -454,6 +546,24 @@ class _EgtaOnlineApi(object):
             A string to optionally filter results by. See the page on
             egtaonline for more information about what this can be. By default
             no filtering is done.
+        prefetch : int, optional
+            The number of pages to request ahead of the page being iterated
+            over once iteration has moved past the first page. Pages are still
+            returned in order, and no more than this many are fetched ahead of
+            a slow consumer. Closing an iterator with `aclose` cancels requests
+            that haven't been sent yet, but requests already sent still reach
+            the server, so this should only be set when most pages will be
+            read.
+        cursor : dict, optional
+            The `cursor` of a previous iterator to resume from. This overrides
+            `page_start`, and the other arguments should match the ones used
+            to create that iterator.
+
+        Simulations are paged by offset, so when new simulations are inserted
+        ahead of the current page, rows shift onto later pages. Simulations
+        are identified by their folder, and any that were on the previous or
+        current page are skipped, so simulations aren't returned twice unless
+        rows shift by more than a page between requests.
         """
         column = _SIMS_MAPPING.get(column, column)
         data = {
@@ -462,45 +572,735 @@ class _EgtaOnlineApi(object):
         }
         if column is not None:
             data['sort'] = column
-        return _SimulationIterator(self._sess, page_start, data)
+        return _SimulationIterator(
+            self._sess, page_start, data, prefetch, cursor)
 
     async def get_simulation(self, folder):
         """Get a simulation from its folder number"""
-        resp = await self._sess.html_non_api_request(
-            'get',
-            'simulations/{:d}'.format(folder))
-        info = resp.xpath('//div[@class="show_for simulation"]/p')
-        parsed = (''.join(e.itertext()).split(':', 1) for e in info)
-        return {key.lower().replace(' ', '_'): _sims_parse(val.strip())
-                for key, val in parsed}
+        info = await self._sess.html_rows_request(
+            'get', 'simulations/{:d}'.format(folder),
+            _RowExtractor(_is_sim_info, 'p', False))
+        parsed = (text.split(':', 1) for text in info)
+        sim = {key.lower().replace(' ', '_'): _sims_parse(val.strip())
+               for key, val in parsed}
+        if isinstance(sim.get('job'), int):
+            self._sess.job_index[sim['job']] = sim['folder_number']
+        return sim
+
+    async def get_simulation_job(self, job):
+        """Get a simulation from its PBS job id
+
+        This returns the same information as `get_simulations`. Jobs are
+        looked up in the api's `job_index` first, and found with a search if
+        they're not there, so this usually makes one request. Stale index
+        entries, including ones for folders that no longer exist, are
+        dropped and cost an extra request before the search."""
+        folder = self._sess.job_index.get(job)
+        if folder is not None:
+            try:
+                info = await self.get_simulation(folder)
+            except requests.exceptions.HTTPError:
+                info = {}
+            if info.get('job') == job:
+                return _detail_row(info)
+            del self._sess.job_index[job]
+        rows = await self._sess.html_rows_request(
+            'get', 'simulations', _RowExtractor(_is_tbody, 'tr', True),
+            data={'search': 'job="{:d}"'.format(job)})
+        if not rows:
+            raise ValueError('No simulation with job id {:d}'.format(job))
+        elif len(rows) > 1:  # pragma: no cover
+            raise ValueError((
+                'Somehow there were multiple simulations with the same job id '
+                '{:d}').format(job))
+        sim = dict(zip(_SIMS_MAPPING, map(_sims_parse, rows[0])))
+        self._sess.job_index[job] = sim['folder']
+        return sim
+
+    def watch_simulations(
+            self, select=None, min_interval=5, max_interval=300):
+        """Watch simulations for state changes
+
+        Every subscription from this api shares one watcher that polls the
+        newest simulations and listings of each unfinished state, and only
+        fetches the detail of watched simulations that stop being listed.
+        Simulations that exist when the watcher starts are only
+        watched if they haven't finished. Polling starts every `min_interval`
+        seconds, and the interval doubles up to `max_interval` while nothing
+        changes. The shortest intervals of every subscription are used.
+
+        Parameters
+        ----------
+        select : (event) -> bool, optional
+            Only events this returns true for are returned. By default all
+            events are.
+        min_interval : float, optional
+            The minimum number of seconds between polls.
+        max_interval : float, optional
+            The maximum number of seconds between polls.
+
+        Returns
+        -------
+        events : AsyncIterator
+            An iterator of events, which are simulations with their `state`,
+            and the `old_state` before the change. New simulations have an
+            `old_state` of None. The iterator should be closed with `aclose`
+            to stop watching, and raises any error from polling.
+        """
+        return _SimulationSubscription(
+            self._watcher, select, min_interval, max_interval)
+
+    def get_simulations_detail(self, folders, concurrency=8):
+        """Get simulations from their folder numbers
+
+        Parameters
+        ----------
+        folders : iterable of int
+            The folder numbers of the simulations. Repeated folders are only
+            fetched once.
+        concurrency : int, optional
+            The maximum number of simulations to fetch at once.
+
+        Returns
+        -------
+        sims : AsyncIterator
+            An iterator of the same information as `get_simulation` in the
+            order that it's fetched, not the order of `folders`. Iterators that
+            aren't exhausted should be closed with `aclose` to cancel pending
+            requests.
+        """
+        return _DetailIterator(self, folders, concurrency)
 
 
-class _SimulationIterator(object): # pylint: disable=too-few-public-methods
-    """AsyncIterator for simulations"""
-    def __init__(self, session, page_start, data):
+class _SimulationIterator(object): # pylint: disable=too-many-instance-attributes
+    """AsyncIterator for simulations
+
+    After the first page, pages are requested `prefetch` pages ahead of the
+    current page, and iteration stops at the first empty page. Folders that
+    were on the previous or current page are skipped if they appear again, so
+    rows shifting by less than a page aren't returned twice, and the number
+    skipped is kept in `duplicates`."""
+    def __init__( # pylint: disable=too-many-arguments
+            self, session, page_start, data, prefetch, cursor=None):
         self._sess = session
         self._data = data
+        if cursor is not None:
+            page_start = cursor['page']
         self._page = itertools.count(page_start)
+        self._current = page_start
+        self._prefetch = prefetch
+        self._started = False
+        self._pending = collections.deque()
         self._rows = iter(())
+        self._done = False
+        self._previous = set()
+        self._seen = set(() if cursor is None else cursor['seen'])
+        self.duplicates = 0
 
     def __aiter__(self):
         return self
 
+    @property
+    def cursor(self):
+        """A position to resume iteration from
+
+        The cursor is the page of the last returned simulation and the folders
+        seen on it and the page before, so rows that shifted are still skipped
+        after resuming. It only contains lists and ints, and so can be
+        serialized as json."""
+        return {'page': self._current,
+                'seen': sorted(self._previous | self._seen)}
+
+    def _fill(self, prefetch):
+        """Request pages until `prefetch` are in flight after the next one"""
+        while not self._done and len(self._pending) <= prefetch:
+            page = next(self._page)
+            data = dict(self._data, page=page)
+            fut = asyncio.ensure_future(self._sess.html_rows_request(
+                'get', 'simulations', _RowExtractor(_is_tbody, 'tr', True),
+                data=data))
+            fut.add_done_callback(_retrieve_exception)
+            self._pending.append((page, fut))
+
+    async def _next_page(self):
+        """Get the rows of the next page"""
+        self._fill(self._prefetch if self._started else 0)
+        self._started = True
+        page, fut = self._pending.popleft()
+        try:
+            rows = await fut
+        except BaseException:
+            await self.aclose()
+            raise
+        self._current = page
+        self._previous = self._seen
+        self._seen = set()
+        if not rows:
+            await self.aclose()
+        return iter(rows)
+
     async def __anext__(self):
+        while True:
+            for row in self._rows:
+                sim = dict(zip(_SIMS_MAPPING, map(_sims_parse, row)))
+                seen = (sim['folder'] in self._seen or
+                        sim['folder'] in self._previous)
+                self._seen.add(sim['folder'])
+                if seen:
+                    self.duplicates += 1
+                    continue
+                if isinstance(sim['job'], int):
+                    self._sess.job_index[sim['job']] = sim['folder']
+                return sim
+            if self._done:
+                raise StopAsyncIteration
+            self._rows = await self._next_page()
+
+    async def aclose(self):
+        """Stop iterating and cancel any pending page requests"""
+        self._done = True
+        self._rows = iter(())
+        while self._pending:
+            self._pending.popleft()[1].cancel()
+
+
+class _SimulationWatcher(object):
+    """Poller of simulation state changes shared by subscriptions"""
+    def __init__(self, eoapi):
+        self._api = eoapi
+        self._subs = set()
+        self._task = None
+        self._newest = None
+        self._active = {}
+
+    def subscribe(self, sub):
+        """Add a subscription, starting to poll if necessary"""
+        self._subs.add(sub)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    def unsubscribe(self, sub):
+        """Remove a subscription, stopping polling if it was the last"""
+        self._subs.discard(sub)
+        if not self._subs:
+            self.stop()
+
+    def close(self):
+        """End every subscription and stop polling"""
+        for sub in list(self._subs):
+            sub.put(None)
+        self._subs.clear()
+        self.stop()
+
+    def stop(self):
+        """Stop polling and forget the simulations being watched"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._newest = None
+        self._active.clear()
+
+    async def _run(self):
+        """Poll until stopped"""
         try:
-            row = next(self._rows)
-        except StopIteration:
-            self._data['page'] = next(self._page)
-            resp = await self._sess.html_non_api_request(
-                'get', 'simulations', data=self._data)
-            self._rows = iter(resp.xpath('//tbody/tr'))
+            await self._start()
+            interval = 0
+            while True:
+                min_interval = min(sub.min_interval for sub in self._subs)
+                max_interval = min(sub.max_interval for sub in self._subs)
+                interval = max(min(interval * 2, max_interval), min_interval)
+                await asyncio.sleep(interval)
+                if await self._poll():
+                    interval = 0
+        except asyncio.CancelledError:
+            raise
+        except Exception as ex: # pylint: disable=broad-except
+            for sub in list(self._subs):
+                sub.put(ex)
+            self._task = None
+            self.stop()
+
+    async def _start(self):
+        """Find the newest and unfinished simulations
+
+        The newest simulation is watched if it's unfinished, and the rest are
+        found by listing each unfinished state. Simulations that finish before
+        their listing is read were never watched, and any that change after
+        they're seen are caught by polling."""
+        self._newest = -1
+        sims = self._api.get_simulations(column='folder')
+        try:
+            sim = await sims.__anext__()
+            self._newest = sim['folder']
+            if sim['state'] not in _TERMINAL_STATES:
+                self._active[sim['folder']] = sim
+        except StopAsyncIteration:
+            pass
+        finally:
+            await sims.aclose()
+        self._active.update(await self._unfinished())
+
+    async def _unfinished(self):
+        """Get unfinished simulations that aren't newer than the newest
+
+        States are listed in the order simulations move through them, so a
+        simulation seen in more than one has its latest state."""
+        unfinished = {}
+        for state in _UNFINISHED_STATES:
+            sims = self._api.get_simulations(
+                search='state="{}"'.format(state))
             try:
-                row = next(self._rows)
-            except StopIteration:
+                async for sim in sims:
+                    if sim['folder'] <= self._newest:
+                        unfinished[sim['folder']] = sim
+            finally:
+                await sims.aclose()
+        return unfinished
+
+    async def _poll(self):
+        """Publish changes since the last poll, returning if any changed
+
+        New simulations come from the newest page, and the states of watched
+        ones from listings of the unfinished states. Only watched simulations
+        that aren't listed anymore are fetched individually to find how they
+        finished."""
+        events = []
+        newest = self._newest
+        sims = self._api.get_simulations(column='folder')
+        try:
+            async for sim in sims:
+                if sim['folder'] <= self._newest:
+                    break
+                newest = max(newest, sim['folder'])
+                events.append(dict(sim, old_state=None))
+        finally:
+            await sims.aclose()
+        self._newest = newest
+        events.reverse()
+
+        watched = dict(self._active)
+        watched.update((event['folder'], event) for event in events
+                       if event['state'] not in _TERMINAL_STATES)
+        for folder, sim in sorted((await self._unfinished()).items()):
+            old = watched.pop(folder, None)
+            if old is None:
+                # It moved between listings before it was seen
+                self._active[folder] = sim
+            elif sim['state'] != old['state']:
+                events.append(dict(sim, old_state=old['state']))
+
+        infos = self._api.get_simulations_detail(list(watched))
+        try:
+            async for info in infos:
+                sim = _detail_row(info)
+                old = watched[sim['folder']]
+                if sim['state'] != old['state']:
+                    events.append(dict(sim, old_state=old['state']))
+        finally:
+            await infos.aclose()
+
+        for event in events:
+            if event['state'] in _TERMINAL_STATES:
+                self._active.pop(event['folder'], None)
+            else:
+                self._active[event['folder']] = event
+            for sub in list(self._subs):
+                sub.put(event)
+        return bool(events)
+
+
+class _SimulationSubscription(object):
+    """AsyncIterator of simulation events from a watcher"""
+    def __init__(self, watcher, select, min_interval, max_interval):
+        assert 0 < min_interval <= max_interval, \
+            'intervals must be positive and ordered'
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self._watcher = watcher
+        self._select = select
+        self._queue = asyncio.Queue()
+        self._closed = False
+        watcher.subscribe(self)
+
+    def __aiter__(self):
+        return self
+
+    def put(self, event):
+        """Add an event, error, or None to end the subscription"""
+        if (event is None or isinstance(event, BaseException) or
+                self._select is None or self._select(event)):
+            self._queue.put_nowait(event)
+
+    async def __anext__(self):
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        event = await self._queue.get()
+        if event is None:
+            raise StopAsyncIteration
+        elif isinstance(event, BaseException):
+            await self.aclose()
+            raise event
+        return event
+
+    async def aclose(self):
+        """Stop watching"""
+        if not self._closed:
+            self._closed = True
+            self._watcher.unsubscribe(self)
+            self._queue.put_nowait(None)
+
+
+class _SchedulerWait(object): # pylint: disable=too-many-instance-attributes,too-few-public-methods
+    """The state of waiting on one scheduler"""
+    def __init__(self, sched_id, min_interval, max_interval, concurrency):
+        assert 0 < min_interval <= max_interval, \
+            'intervals must be positive and ordered'
+        assert concurrency > 0, 'concurrency must be positive'
+        self.id = sched_id # pylint: disable=invalid-name
+        self.future = asyncio.Future()
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.concurrency = concurrency
+        self.interval = min_interval
+        self.due = 0
+        self.polled = None
+        self.done = 0
+        self.refs = 0
+
+    def update(self, reqs, now):
+        """Schedule the next poll from the scheduler's progress"""
+        done = sum(min(req['current_count'], req['requirement'])
+                   for req in reqs)
+        remaining = sum(req['requirement'] for req in reqs) - done
+        if self.polled is None:
+            interval = self.min_interval
+        elif done > self.done:
+            interval = remaining * (now - self.polled) / (done - self.done) / 2
+        else:
+            interval = self.interval * 2
+        self.interval = min(max(interval, self.min_interval),
+                            self.max_interval)
+        self.polled = now
+        self.done = done
+        self.due = now + self.interval
+
+
+class _SchedulerWaiter(object):
+    """Poller of scheduler completion shared by waits"""
+    def __init__(self, session):
+        self._sess = session
+        self._waits = {}
+        self._task = None
+        self._wake = asyncio.Event()
+
+    async def wait(self, sched_id, min_interval, max_interval, concurrency):
+        """Wait for a scheduler to complete"""
+        wait = self._waits.get(sched_id)
+        if wait is None:
+            wait = _SchedulerWait(
+                sched_id, min_interval, max_interval, concurrency)
+            self._waits[sched_id] = wait
+            self._wake.set()
+            if self._task is None or self._task.done():
+                self._task = asyncio.ensure_future(self._run())
+                self._task.add_done_callback(self._stopped)
+        else:
+            wait.min_interval = min(wait.min_interval, min_interval)
+            wait.max_interval = min(wait.max_interval, max_interval)
+            wait.concurrency = min(wait.concurrency, concurrency)
+            if wait.polled is not None:
+                wait.due = min(wait.due, wait.polled + wait.min_interval)
+                self._wake.set()
+        wait.refs += 1
+        try:
+            return await asyncio.shield(wait.future)
+        finally:
+            wait.refs -= 1
+            if not wait.refs and self._waits.get(sched_id) is wait:
+                # Everything waiting was cancelled
+                del self._waits[sched_id]
+                wait.future.cancel()
+
+    def _stopped(self, task):
+        """Forget the polling task once it stops"""
+        if self._task is task:
+            self._task = None
+
+    def close(self):
+        """Stop polling and cancel every wait"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        for wait in self._waits.values():
+            wait.future.cancel()
+        self._waits.clear()
+
+    async def _run(self):
+        """Poll schedulers until nothing is waiting"""
+        loop = asyncio.get_event_loop()
+        while self._waits:
+            now = loop.time()
+            due = [wait for wait in self._waits.values()
+                   if wait.due <= now]
+            if due:
+                limit = asyncio.Semaphore(min(
+                    wait.concurrency for wait in self._waits.values()))
+                await asyncio.gather(*[
+                    self._poll(wait, limit) for wait in due])
+                continue
+            self._wake.clear()
+            timeout = min(wait.due for wait in self._waits.values()) - now
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _poll(self, wait, limit):
+        """Poll one scheduler"""
+        loop = asyncio.get_event_loop()
+        try:
+            async with limit:
+                reqs = await _Scheduler(
+                    self._sess, id=wait.id).get_requirements()
+        except Exception as ex: # pylint: disable=broad-except
+            self._finish(wait, exception=ex)
+            return
+        if _is_complete(reqs):
+            self._finish(wait, result=reqs)
+        else:
+            wait.update(reqs['scheduling_requirements'], loop.time())
+
+    def _finish(self, wait, result=None, exception=None):
+        """Resolve a wait"""
+        if self._waits.get(wait.id) is wait:
+            del self._waits[wait.id]
+        if wait.future.done():
+            return
+        elif exception is None:
+            wait.future.set_result(result)
+        else:
+            wait.future.set_exception(exception)
+
+
+class _ProgressTracker(object): # pylint: disable=too-few-public-methods
+    """Tracker of a scheduler's progress from snapshots of its requirements"""
+    def __init__(self, smoothing):
+        assert 0 < smoothing <= 1, 'smoothing must be in (0, 1]'
+        self._smoothing = smoothing
+        self._time = None
+        self._completed = None
+        self._throughput = None
+
+    def update(self, reqs, now):
+        """Get the progress from a new snapshot taken at time `now`"""
+        profs = reqs['scheduling_requirements']
+        completed = sum(min(prof['current_count'], prof['requirement'])
+                        for prof in profs)
+        required = sum(prof['requirement'] for prof in profs)
+        if self._time is not None and now > self._time:
+            rate = (completed - self._completed) / (now - self._time)
+            if self._throughput is None:
+                self._throughput = rate
+            else:
+                self._throughput += self._smoothing * (
+                    rate - self._throughput)
+        self._time = now
+        self._completed = completed
+        remaining = required - completed
+        if not remaining:
+            eta = 0
+        elif self._throughput is not None and self._throughput > 0:
+            eta = remaining / self._throughput
+        else:
+            eta = None
+        return {
+            'id': reqs['id'],
+            'active': reqs['active'],
+            'completed': completed,
+            'required': required,
+            'fraction': completed / required if required else 1.0,
+            'throughput': self._throughput,
+            'eta': eta,
+            'complete': _is_complete(reqs),
+        }
+
+
+class _ProgressIterator(object):
+    """AsyncIterator of the progress of a scheduler"""
+    def __init__(self, sched, interval, smoothing):
+        assert interval > 0, 'interval must be positive'
+        self._sched = sched
+        self._interval = interval
+        self._tracker = _ProgressTracker(smoothing)
+        self._polled = False
+        self._done = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._done:
+            raise StopAsyncIteration
+        elif self._polled:
+            await asyncio.sleep(self._interval)
+        self._polled = True
+        reqs = await self._sched.get_requirements()
+        progress = self._tracker.update(
+            reqs, asyncio.get_event_loop().time())
+        self._done = progress['complete']
+        return progress
+
+    async def aclose(self):
+        """Stop tracking progress"""
+        self._done = True
+
+
+class _CompletedIterator(object):
+    """AsyncIterator of the results of awaitables as they complete"""
+    def __init__(self, awaitables):
+        self._pending = {asyncio.ensure_future(aw) for aw in awaitables}
+        for fut in self._pending:
+            fut.add_done_callback(_retrieve_exception)
+        self._done = collections.deque()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._done:
+            if not self._pending:
+                raise StopAsyncIteration
+            done, self._pending = await asyncio.wait(
+                self._pending, return_when=asyncio.FIRST_COMPLETED)
+            self._done.extend(done)
+        try:
+            return self._done.popleft().result()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        """Stop iterating and cancel anything pending"""
+        self._done.clear()
+        while self._pending:
+            self._pending.pop().cancel()
+
+
+class _DetailIterator(object):
+    """AsyncIterator for simulation details as they're fetched"""
+    def __init__(self, eoapi, folders, concurrency):
+        assert concurrency > 0, 'concurrency must be positive'
+        self._api = eoapi
+        self._folders = iter(folders)
+        self._concurrency = concurrency
+        self._seen = set()
+        self._pending = set()
+        self._done = collections.deque()
+
+    def __aiter__(self):
+        return self
+
+    def _fill(self):
+        """Start fetching folders until `concurrency` are pending"""
+        while len(self._pending) < self._concurrency:
+            folder = next(self._folders, None)
+            if folder is None:
+                return
+            elif folder not in self._seen:
+                self._seen.add(folder)
+                fut = asyncio.ensure_future(self._api.get_simulation(folder))
+                fut.add_done_callback(_retrieve_exception)
+                self._pending.add(fut)
+
+    async def __anext__(self):
+        if not self._done:
+            self._fill()
+            if not self._pending:
                 raise StopAsyncIteration
-        res = (_sims_parse(''.join(e.itertext()))  # pragma: no branch
-               for e in row.getchildren())
-        return dict(zip(_SIMS_MAPPING, res))
+            done, self._pending = await asyncio.wait(
+                self._pending, return_when=asyncio.FIRST_COMPLETED)
+            self._done.extend(done)
+        try:
+            return self._done.popleft().result()
+        except BaseException:
+            await self.aclose()
+            raise
+
+    async def aclose(self):
+        """Stop iterating and cancel any pending requests"""
+        self._folders = iter(())
+        self._done.clear()
+        while self._pending:
+            self._pending.pop().cancel()
+
+
+class _RowExtractor(object):
+    """An lxml parser target that extracts rows of text without a tree
+
+    Rows are the `row` tag children of the first element that `container`
+    returns true for. If `cells`, each row is a tuple of the text of the row's
+    children, otherwise it's the text of the row itself. Text is the same as
+    joining `itertext` of the element. Closing the parser returns the list of
+    rows."""
+    def __init__(self, container, row, cells):
+        self._container = container
+        self._row = row
+        self._cells = cells
+        self._depth = None
+        self._in_row = False
+        self._text = []
+        self._row_cells = []
+        self.rows = []
+        self.done = False
+
+    def start(self, tag, attrib):
+        """Handle an element opening"""
+        if self.done:
+            return
+        elif self._depth is None:
+            if self._container(tag, attrib):
+                self._depth = 0
+            return
+        self._depth += 1
+        if self._depth == 1:
+            self._in_row = tag == self._row
+            self._row_cells = []
+            self._text = []
+        elif self._depth == 2 and self._cells:
+            self._text = []
+
+    def data(self, data):
+        """Handle text"""
+        if self._in_row and self._depth >= (2 if self._cells else 1):
+            self._text.append(data)
+
+    def end(self, _):
+        """Handle an element closing"""
+        if self._depth is None or self.done:
+            return
+        elif self._depth == 0:
+            self.done = True
+        elif self._in_row and self._depth == 1:
+            self.rows.append(tuple(self._row_cells) if self._cells
+                             else ''.join(self._text))
+            self._in_row = False
+        elif self._in_row and self._depth == 2 and self._cells:
+            self._row_cells.append(''.join(self._text))
+        self._depth -= 1
+
+    def close(self):
+        """Finish parsing"""
+        return self.rows
+
+
+def _is_tbody(tag, _):
+    """Test if an element is the body of a table"""
+    return tag == 'tbody'
+
+
+def _is_sim_info(tag, attrib):
+    """Test if an element is the block of simulation information"""
+    return tag == 'div' and attrib.get('class') == 'show_for simulation'
 
 
 class _Simulator(_Base):
@@ -652,6 +1452,70 @@ class _Scheduler(_Base):
             'schedulers/{sched_id}.json'.format(sched_id=self['id']))
         return _Scheduler(self._sess, resp.json())
 
+    async def wait_complete(
+            self, min_interval=5, max_interval=300, concurrency=8):
+        """Wait for the scheduler to complete
+
+        A scheduler is complete when every profile has met its requirement.
+        Inactive schedulers don't make progress, so waiting on one continues
+        until it's reactivated and completes, or the wait is cancelled.
+        Whether it's `active` is in the requirements it completed with. Every
+        wait from an api shares the same poller, so
+        waiting on a scheduler more than once only polls it once, and no more
+        than `concurrency` schedulers are polled at a time. Each scheduler is
+        polled again after the time it would take to get halfway to complete
+        at its observed rate, bounded by the intervals. If it didn't make
+        progress the interval doubles instead. When waits are shared, the
+        smallest parameters are used.
+
+        Parameters
+        ----------
+        min_interval : float, optional
+            The minimum number of seconds between polls of this scheduler.
+        max_interval : float, optional
+            The maximum number of seconds between polls of this scheduler.
+        concurrency : int, optional
+            The maximum number of schedulers to poll at once.
+
+        Returns
+        -------
+        requirements : Scheduler
+            The requirements of the scheduler when it completed, as returned
+            by `get_requirements`.
+        """
+        return await self._sess.waiter.wait(
+            self['id'], min_interval, max_interval, concurrency)
+
+    def get_progress(self, interval=60, smoothing=0.3):
+        """Track the progress of the scheduler
+
+        The scheduler's requirements are polled every `interval` seconds, and
+        a progress record is returned for each poll until the scheduler
+        completes, as defined in `wait_complete`, so progress of an inactive
+        scheduler is tracked until it's reactivated and completes, or the
+        iterator is closed.
+
+        Parameters
+        ----------
+        interval : float, optional
+            The number of seconds between polls.
+        smoothing : float, optional
+            The weight of the newest throughput in the exponentially weighted
+            average of throughput, between 0 and 1.
+
+        Returns
+        -------
+        progress : AsyncIterator
+            An iterator of records with the scheduler `id`, if it's `active`,
+            the number of observations `completed` and `required`, their
+            `fraction`, the smoothed `throughput` in observations per second,
+            the `eta` in seconds, and if it's `complete`. `throughput` is None
+            until two polls have been made, and `eta` is None unless
+            throughput is positive or nothing remains. Throughput can be
+            negative if requirements are lowered.
+        """
+        return _ProgressIterator(self, interval, smoothing)
+
     async def get_requirements(self):
         """Get the schedulign requirements of a scheduler"""
         resp = await self._sess.request(
@@ -1073,11 +1937,25 @@ class _Game(_Base):
 
 def api( # pylint: disable=too-many-arguments
         auth_token=None, domain=auth.DOMAIN, retry_on=(504,), num_tries=20,
-        retry_delay=20, retry_backoff=1.2, executor=None):
-    """Create an api object"""
+        retry_delay=20, retry_backoff=1.2, executor=None,
+        session_factory=requests.Session, job_index=None):
+    """Create an api object
+
+    Parameters
+    ----------
+    session_factory : () -> requests.Session, optional
+        Called to create the http session when the api is opened. This allows
+        using sessions with custom transport adapters.
+    job_index : {int: int}, optional
+        A mutable mapping from job ids to folder numbers that's filled in as
+        simulations are fetched, and used by `get_simulation_job`. Passing a
+        persistent mapping, like `mirror.JobIndex`, keeps it between apis.
+        By default a new dict is used.
+    """
     return _EgtaOnlineApi(
         auth.load() if auth_token is None else auth_token, domain, retry_on,
-        num_tries, retry_delay, retry_backoff, executor)
+        num_tries, retry_delay, retry_backoff, executor, session_factory,
+        job_index)
 
 
 def symgrps_to_assignment(symmetry_groups):
@@ -1094,6 +1972,7 @@ def symgrps_to_assignment(symmetry_groups):
         for role, strats in sorted(roles.items()))
 
 
+_HTML_CHUNK_SIZE = 1 << 13
 _SIMS_MAPPING = collections.OrderedDict([
     ('state', 'state'),
     ('profile', 'profiles.assignment'),
@@ -1101,6 +1980,15 @@ _SIMS_MAPPING = collections.OrderedDict([
     ('folder', 'id'),
     ('job', 'job_id'),
 ])
+_TERMINAL_STATES = frozenset(['complete', 'failed', 'canceled'])
+_UNFINISHED_STATES = ('pending', 'queued', 'running', 'processing')
+_SIMS_DETAIL_MAPPING = collections.OrderedDict([
+    ('state', 'state'),
+    ('profile', 'profile'),
+    ('simulator', 'simulator_fullname'),
+    ('folder', 'folder_number'),
+    ('job', 'job'),
+])
 
 # Schemata
 _PROF_STRUCT_SCHEMA = {
@@ -1288,6 +2176,45 @@ _GAME_SCHEMATA = {
 _NO_SCHEMA = {'type': ['string', 'object']}
 
 
+def _is_complete(reqs):
+    """Test if every profile of scheduler requirements has been met"""
+    return all(prof['current_count'] >= prof['requirement']
+               for prof in reqs['scheduling_requirements'])
+
+
+def _detail_row(info):
+    """Convert simulation detail to the fields of a listed simulation"""
+    sim = {key: info[detail] for key, detail in _SIMS_DETAIL_MAPPING.items()}
+    if not isinstance(sim['job'], int):
+        sim['job'] = float('nan')
+    return sim
+
+
+def _feed_rows(resp, rows):
+    """Feed a streamed response to a row extractor until it's done
+
+    The rest of the body is read without parsing it, so the connection can
+    be reused."""
+    parser = etree.HTMLParser(target=rows, encoding=resp.encoding)
+    chunks = resp.iter_content(_HTML_CHUNK_SIZE)
+    for chunk in chunks:
+        parser.feed(chunk)
+        if rows.done:
+            break
+    for _ in chunks:
+        pass
+    return parser.close()
+
+
+def _retrieve_exception(fut):
+    """Mark the exception of a future as retrieved
+
+    Prefetched requests may fail after iteration stops, which shouldn't be
+    reported."""
+    if not fut.cancelled():
+        fut.exception()
+
+
 def _sims_parse(res):
     """Converts N/A to `nan` and otherwise tries to parse integers"""
     try:
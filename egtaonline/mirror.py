@@ -0,0 +1,318 @@
+"""Local sqlite mirror of egta online simulations
+
+Syncing pages through simulations by descending folder until it reaches rows
+that are already mirrored and unchanged, and then refreshes the simulations
+that haven't finished yet. Queries run locally against indexed columns.
+
+This also has a persistent index of job ids to folders, and a persistent
+cache of scheduler requirements for apis.
+"""
+import collections.abc
+import json
+import sqlite3
+import time
+
+from egtaonline import api
+
+
+TERMINAL_STATES = api._TERMINAL_STATES # pylint: disable=protected-access
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS simulations (
+    folder INTEGER PRIMARY KEY,
+    job INTEGER,
+    state TEXT NOT NULL,
+    profile TEXT NOT NULL,
+    simulator TEXT NOT NULL,
+    first_seen REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS simulations_job ON simulations (job);
+CREATE INDEX IF NOT EXISTS simulations_state
+    ON simulations (state, first_seen);
+CREATE INDEX IF NOT EXISTS simulations_simulator
+    ON simulations (simulator, first_seen);
+"""
+_COLUMNS = ('folder', 'job', 'state', 'profile', 'simulator', 'first_seen',
+            'updated')
+
+
+def _job(job):
+    """Convert a parsed job to an int or None"""
+    return job if isinstance(job, int) else None
+
+
+class Mirror(object):
+    """A local mirror of simulations
+
+    Parameters
+    ----------
+    path : str
+        The path to the sqlite database. It's created if it doesn't exist, and
+        `':memory:'` creates a mirror that isn't saved.
+    """
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.executescript(_SCHEMA)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Close the database"""
+        self._conn.close()
+
+    def __len__(self):
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM simulations').fetchone()[0]
+
+    def _upsert(self, sim, now):
+        """Add or update a listed simulation, returning if it changed"""
+        row = (_job(sim['job']), sim['state'], sim['profile'],
+               sim['simulator'])
+        old = self._conn.execute(
+            'SELECT job, state, profile, simulator FROM simulations '
+            'WHERE folder = ?', (sim['folder'],)).fetchone()
+        if old is None:
+            self._conn.execute(
+                'INSERT INTO simulations VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (sim['folder'],) + row + (now, now))
+            return 'added'
+        elif tuple(old) == row:
+            return None
+        else:
+            self._conn.execute(
+                'UPDATE simulations SET job = ?, state = ?, profile = ?, '
+                'simulator = ?, updated = ? WHERE folder = ?',
+                row + (now, sim['folder']))
+            return 'updated'
+
+    async def sync(self, eoapi, concurrency=8):
+        """Bring the mirror up to date
+
+        Parameters
+        ----------
+        eoapi : EgtaOnlineApi
+            An open api to sync from.
+        concurrency : int, optional
+            The maximum number of simulations to refresh at once.
+
+        Returns
+        -------
+        stats : {str: int}
+            The number of simulations that were `added` or `updated` from the
+            listing, and the number of unfinished simulations that were
+            `refreshed` individually.
+        """
+        now = time.time()
+        stats = {'added': 0, 'updated': 0, 'refreshed': 0}
+        listed = set()
+        sims = eoapi.get_simulations(column='folder', prefetch=0)
+        try:
+            with self._conn:
+                async for sim in sims:
+                    change = self._upsert(sim, now)
+                    if change is None:
+                        break
+                    stats[change] += 1
+                    listed.add(sim['folder'])
+        finally:
+            await sims.aclose()
+
+        unfinished = [
+            folder for folder, in self._conn.execute(
+                'SELECT folder FROM simulations WHERE state NOT IN ({})'
+                .format(', '.join('?' * len(TERMINAL_STATES))),
+                tuple(TERMINAL_STATES))
+            if folder not in listed]
+        infos = eoapi.get_simulations_detail(unfinished, concurrency)
+        try:
+            with self._conn:
+                async for info in infos:
+                    job = _job(info['job'])
+                    cur = self._conn.execute(
+                        'UPDATE simulations SET job = ?, state = ?, '
+                        'updated = ? WHERE folder = ? AND '
+                        '(job IS NOT ? OR state != ?)',
+                        (job, info['state'], now, info['folder_number'], job,
+                         info['state']))
+                    stats['refreshed'] += cur.rowcount
+        finally:
+            await infos.aclose()
+        return stats
+
+    def query( # pylint: disable=too-many-arguments
+            self, state=None, simulator=None, profile=None, since=None,
+            limit=None):
+        """Get mirrored simulations by descending folder
+
+        Parameters
+        ----------
+        state : str, optional
+            Only get simulations in this state.
+        simulator : str, optional
+            Only get simulations of this simulator fullname.
+        profile : str, optional
+            Only get simulations whose profile contains this substring.
+        since : float, optional
+            Only get simulations first mirrored at or after this unix time.
+        limit : int, optional
+            The maximum number of simulations to get.
+
+        Returns
+        -------
+        sims : [{str: object}]
+            The simulations with the listing's fields, and the unix times
+            they were `first_seen` and last `updated` in the mirror.
+        """
+        clauses = []
+        params = []
+        for clause, param in [('state = ?', state),
+                              ('simulator = ?', simulator),
+                              ('instr(profile, ?) > 0', profile),
+                              ('first_seen >= ?', since)]:
+            if param is not None:
+                clauses.append(clause)
+                params.append(param)
+        sql = 'SELECT {} FROM simulations'.format(', '.join(_COLUMNS))
+        if clauses:
+            sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY folder DESC'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+        return [dict(row) for row in self._conn.execute(sql, params)]
+
+
+class JobIndex(collections.abc.MutableMapping):
+    """A persistent mapping of job ids to folder numbers
+
+    This can be passed as the `job_index` of an api. Changes are saved when
+    the index is closed or `commit` is called.
+
+    Parameters
+    ----------
+    path : str
+        The path to the sqlite database. It can be the same as a mirror's.
+    """
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS jobs '
+            '(job INTEGER PRIMARY KEY, folder INTEGER NOT NULL)')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def commit(self):
+        """Save changes to the index"""
+        self._conn.commit()
+
+    def close(self):
+        """Save changes and close the database"""
+        self.commit()
+        self._conn.close()
+
+    def __getitem__(self, job):
+        row = self._conn.execute(
+            'SELECT folder FROM jobs WHERE job = ?', (job,)).fetchone()
+        if row is None:
+            raise KeyError(job)
+        return row[0]
+
+    def __setitem__(self, job, folder):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO jobs VALUES (?, ?)', (job, folder))
+
+    def __delitem__(self, job):
+        if not self._conn.execute(
+                'DELETE FROM jobs WHERE job = ?', (job,)).rowcount:
+            raise KeyError(job)
+
+    def __iter__(self):
+        return (job for job, in self._conn.execute('SELECT job FROM jobs'))
+
+    def __len__(self):
+        return self._conn.execute('SELECT COUNT(*) FROM jobs').fetchone()[0]
+
+
+class RequirementsCache(collections.abc.MutableMapping):
+    """A persistent mapping of scheduler ids to recent requirements
+
+    This can be passed as the `cache` of `get_requirements_all`. Requirements
+    are stored as json, and expire `ttl` seconds after they're added. Changes
+    are saved when the cache is closed or `commit` is called.
+
+    Parameters
+    ----------
+    path : str
+        The path to the sqlite database. It can be the same as a mirror's.
+    ttl : float
+        The number of seconds requirements stay in the cache.
+    """
+    def __init__(self, path, ttl):
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS requirements '
+            '(id INTEGER PRIMARY KEY, added REAL NOT NULL, data TEXT NOT NULL)')
+        self._ttl = ttl
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def commit(self):
+        """Save changes to the cache"""
+        self._conn.commit()
+
+    def close(self):
+        """Save changes and close the database"""
+        self.commit()
+        self._conn.close()
+
+    def _oldest(self):
+        """The oldest time that hasn't expired"""
+        return time.time() - self._ttl
+
+    def __getitem__(self, sched_id):
+        row = self._conn.execute(
+            'SELECT data FROM requirements WHERE id = ? AND added >= ?',
+            (sched_id, self._oldest())).fetchone()
+        if row is None:
+            raise KeyError(sched_id)
+        return json.loads(row[0])
+
+    def __setitem__(self, sched_id, reqs):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO requirements VALUES (?, ?, ?)',
+            (sched_id, time.time(), json.dumps(reqs)))
+
+    def __delitem__(self, sched_id):
+        if not self._conn.execute(
+                'DELETE FROM requirements WHERE id = ? AND added >= ?',
+                (sched_id, self._oldest())).rowcount:
+            raise KeyError(sched_id)
+
+    def __iter__(self):
+        return (sched_id for sched_id, in self._conn.execute(
+            'SELECT id FROM requirements WHERE added >= ?',
+            (self._oldest(),)))
+
+    def __len__(self):
+        return self._conn.execute(
+            'SELECT COUNT(*) FROM requirements WHERE added >= ?',
+            (self._oldest(),)).fetchone()[0]
+
+    def expire(self):
+        """Remove expired requirements from the database"""
+        self._conn.execute(
+            'DELETE FROM requirements WHERE added < ?', (self._oldest(),))
@@ -1,14 +1,17 @@
 """Python package to mock python interface to egta online api"""
 # pylint: disable=too-many-lines
+import array
 import asyncio
 import bisect
 import collections
+import contextlib
 import functools
 import inspect
 import io
 import itertools
 import json
 import math
+import pickle
 import random
 import re
 import threading
@@ -18,16 +21,65 @@ import urllib
 import requests
 import requests_mock
 
+from egtaonline import api
 
-# The mock server isn't intended to be performant, and isn't multiprocessed, so
-# it can over aggressively thread lock without causing any real issues.
-_LOCK = threading.Lock()
+
+class _RWLock(object):
+    """A reader writer lock
+
+    Any number of readers can hold the lock at once, but writers get exclusive
+    access. Waiting writers block new readers so that mutations can't be
+    starved by a steady stream of reads."""
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._waiting = 0
+
+    @contextlib.contextmanager
+    def read(self):
+        """Hold the lock for reading"""
+        with self._cond:
+            while self._writing or self._waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextlib.contextmanager
+    def write(self):
+        """Hold the lock for writing"""
+        with self._cond:
+            self._waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
 
 
 def _matcher(method, regex):
-    """Sets up a regex matcher"""
+    """Sets up a regex matcher
+
+    GET requests only hold the server lock for reading, so they can be served
+    concurrently, every other method mutates server state and gets exclusive
+    access. Every handled request is counted by method and route, where the
+    route is the name of the handler without the leading underscore."""
     def wrapper(func):
         """Wrapper for matching function"""
+        route = func.__name__.lstrip('_')
+
         @functools.wraps(func)
         def wrapped(self, req):
             """Wrapped function to handle mock requests"""
@@ -43,15 +95,17 @@ def _matcher(method, regex):
             named = {match.span(m) for m in match.groupdict()}
             unnamed = [m for i, m in enumerate(match.groups())
                        if match.span(i) not in named]
+            lock = self.lock.read() if method == 'GET' else self.lock.write()
             try:
-                with _LOCK:
-                    return func(self, *unnamed, **keywords)
+                with lock:
+                    resp = func(self, *unnamed, **keywords)
             except AssertionError as ex:
-                resp = requests.Response()
+                resp = _resp()
                 resp.status_code = 500
                 resp.reason = str(ex)
                 resp.url = req.url
-                return resp
+            self.record_request(method, route, resp)
+            return resp
         wrapped.is_matcher = None
         return wrapped
     return wrapper
@@ -61,12 +115,28 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
     """A Mock egta online server with data
 
     When entered this mocks out requests and instead handles them with internal
-    data to replicate what the egta online server would be doing."""
+    data to replicate what the egta online server would be doing. If scoped,
+    requests aren't patched globally, and only sessions with `adapter`
+    mounted are handled."""
 
-    def __init__(self, domain, *args, **kwargs):
+    def __init__( # pylint: disable=too-many-arguments
+            self, domain, virtual_time, auto_advance, seed, slots,
+            node_memory, queue_policy, scoped, cache_size, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        assert queue_policy in _QUEUE_POLICIES, \
+            'unknown queue policy {}'.format(queue_policy)
         self.domain = domain
-        self.loop = asyncio.get_event_loop()
+        self.scoped = scoped
+        self.adapter = requests_mock.Adapter()
+        self.loop = None
+        self.lock = _RWLock()
+        self.rng = random.Random(seed)
+        self._virtual_time = virtual_time
+        self._auto_advance = auto_advance
+        self._now = time.time()
+        self._slots = slots
+        self._node_memory = node_memory
+        self._queue_policy = queue_policy
 
         self._sims = []
         self._sims_by_name = {}
@@ -77,50 +147,239 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
         self._sim_insts = {}
         self._symgrps_tup = {}
         self.profiles = []
-        self.folders = []
-
+        self.folders = _Folders(self)
+        self._folder_index = {
+            'profile': array.array('l'),
+            'simulator': array.array('l'),
+        }
+        # Folders sorted by job, the first `_num_unassigned` haven't started
+        # so they don't have a job yet
+        self._job_index = array.array('l')
+        self._num_unassigned = 0
+        self._next_job = 1
+        # Folders that are waiting for nodes or running, and the nodes and
+        # memory they need
+        self._queued = collections.OrderedDict()
+        self._running = {}
+        self._used = 0
+
+        self._loop_thread = None
         self._sim_future = None
         self.sim_queue = asyncio.PriorityQueue()
+        # Response text by key, least recently used first
+        self._cache = collections.OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._cache_size = cache_size
+        self._cached_bytes = 0
 
         self._custom_func = None
         self._custom_times = 0
 
-        for _, method in inspect.getmembers(self, predicate=inspect.ismethod):
-            if hasattr(method, 'is_matcher'):
-                self.add_matcher(method)
-        self.add_matcher(self._custom_matcher)
+        self._stats_lock = threading.Lock()
+        self.request_counts = collections.Counter()
+        self.request_bytes = collections.Counter()
+
+        matchers = [
+            method for _, method
+            in inspect.getmembers(self, predicate=inspect.ismethod)
+            if hasattr(method, 'is_matcher')]
+        matchers.append(self._custom_matcher)
+        for matcher in matchers:
+            self.adapter.add_matcher(matcher)
+            if not scoped:
+                self.add_matcher(matcher)
 
     async def __aenter__(self):
-        super().__enter__()
+        if not self.scoped:
+            super().__enter__()
         assert self._sim_future is None
-        assert self.sim_queue.empty()
-        self._sim_future = asyncio.ensure_future(self._run_simulations())
+        self.loop = asyncio.get_event_loop()
+        self._loop_thread = threading.get_ident()
+        if not self._virtual_time or self._auto_advance:
+            self._sim_future = asyncio.ensure_future(self._run_simulations())
         return self
 
     async def __aexit__(self, typ, value, traceback):
-        self._sim_future.cancel()
-        try:
-            await self._sim_future
-        except asyncio.CancelledError:
-            pass  # expected
-        self._sim_future = None
+        if self._sim_future is not None:
+            self._sim_future.cancel()
+            try:
+                await self._sim_future
+            except asyncio.CancelledError:
+                pass  # expected
+            self._sim_future = None
         while not self.sim_queue.empty():
             self.sim_queue.get_nowait()
-        return super().__exit__(typ, value, traceback)
+        if not self.scoped:
+            super().__exit__(typ, value, traceback)
+
+    def time(self):
+        """The current time of the server in seconds since the epoch"""
+        return self._now if self._virtual_time else time.time()
 
     async def _run_simulations(self):
-        """Thread to run simulations at specified time"""
+        """Thread to run simulations at specified time
+
+        With virtual time, the clock jumps straight to the next completion
+        instead of sleeping."""
         while True:
-            wait_until, _, obs = await self.sim_queue.get()
-            timeout = max(wait_until - time.time(), 0)
-            await asyncio.sleep(timeout)
-            obs.simulate()
+            item = await self.sim_queue.get()
+            self.sim_queue.put_nowait(item)
+            if self._virtual_time:
+                self._now = max(self._now, item[0])
+            else:
+                await asyncio.sleep(max(item[0] - time.time(), 0))
+            self._complete_due()
+
+    def _complete_due(self):
+        """Finish every running simulation that's due in order
+
+        Each simulation frees its nodes at the time it finished, so queued
+        simulations can start and finish within the same call."""
+        now = self.time()
+        with self.lock.write():
+            while not self.sim_queue.empty():
+                wait_until, fid = self.sim_queue.get_nowait()
+                if wait_until > now:
+                    self.sim_queue.put_nowait((wait_until, fid))
+                    break
+                self._finish(fid, wait_until)
+
+    def _enqueue(self, item):
+        """Add a simulation completion to the queue from any thread"""
+        if threading.get_ident() == self._loop_thread:
+            self.sim_queue.put_nowait(item)
+        else:
+            self.loop.call_soon_threadsafe(self.sim_queue.put_nowait, item)
+
+    def submit(self, prof, nodes, memory, when=None):
+        """Queue a new simulation of a profile on the cluster"""
+        obs = self.add_folder(prof)
+        if self._slots is not None and nodes > self._slots:
+            self.folders.set_state(
+                obs.id, 'failed',
+                'Requires {:d} nodes but the cluster only has {:d}'.format(
+                    nodes, self._slots))
+        elif self._node_memory is not None and memory > self._node_memory:
+            self.folders.set_state(
+                obs.id, 'failed',
+                'Process memory of {:d} MB exceeds node memory of {:d} MB'
+                .format(memory, self._node_memory))
+        else:
+            self._queued[obs.id] = nodes, memory
+            self._start_jobs(self.time() if when is None else when)
+        return obs
+
+    def _start_jobs(self, when):
+        """Start queued simulations that fit on the free nodes
+
+        With the fifo policy simulations start strictly in order, with
+        backfill any later simulation that fits can start first."""
+        started = []
+        for fid, (nodes, _) in self._queued.items():
+            if self._slots is not None and self._used >= self._slots:
+                break
+            elif self._slots is None or self._used + nodes <= self._slots:
+                started.append(fid)
+                self._used += nodes
+            elif self._queue_policy == 'fifo':
+                break
+        for fid in started:
+            self._running[fid] = self._queued.pop(fid)
+            ind = bisect.bisect_left(
+                self._job_index, fid, 0, self._num_unassigned)
+            self._job_index.pop(ind)
+            self._job_index.append(fid)
+            self._num_unassigned -= 1
+            self.folders.start(fid, self._next_job)
+            self._next_job += 1
+            sim = self.profiles[self.folders.profs[fid]].sim
+            self._enqueue((when + sim.delay_dist(), fid))
+
+    def _finish(self, fid, when):
+        """Finish a running simulation, failing it at the simulator's rate"""
+        if fid not in self._running:
+            return  # canceled
+        nodes, memory = self._running.pop(fid)
+        self._used -= nodes
+        prof = self.profiles[self.folders.profs[fid]]
+        if (prof.sim.failure_rate and
+                self.rng.random() < prof.sim.failure_rate):
+            self.folders.set_state(
+                fid, 'failed', 'Simulation exited with a non-zero status')
+            self.submit(prof, nodes, memory, when)
+        else:
+            self.folders[fid].simulate()
+        self._start_jobs(when)
+
+    def cancel(self, fid):
+        """Cancel a queued or running simulation"""
+        state = self._get_folder(fid).state
+        assert state in {'queued', 'running'}, \
+            "can't cancel a {} simulation".format(state)
+        if self._queued.pop(fid, None) is None:
+            nodes, _ = self._running.pop(fid)
+            self._used -= nodes
+        self.folders.set_state(fid, 'canceled')
+        self._start_jobs(self.time())
+
+    def dump(self, fil):
+        """Write a snapshot of the server state to a binary file"""
+        pending = []
+        while not self.sim_queue.empty():
+            pending.append(self.sim_queue.get_nowait())
+        for item in pending:
+            self.sim_queue.put_nowait(item)
+        now = self.time()
+        with self.lock.read():
+            state = {attr: getattr(self, attr) for attr in _SNAPSHOT_ATTRS}
+            state['pending'] = [(wait_until - now, fid) for wait_until, fid
+                                in pending]
+            pickle.dump((_SNAPSHOT_VERSION, self.domain, state), fil,
+                        pickle.HIGHEST_PROTOCOL)
+
+    def load(self, fil, delay_dists, payoff_models):
+        """Replace the server state with a snapshot from a binary file"""
+        version, domain, state = pickle.load(fil)
+        assert version == _SNAPSHOT_VERSION, \
+            'unknown snapshot version {}'.format(version)
+        assert domain == self.domain, \
+            "snapshot domain {} doesn't match {}".format(domain, self.domain)
+        now = self.time()
+        with self.lock.write():
+            assert not self._sims, "can't load into a server with data"
+            for sim in state['_sims']:
+                sim.delay_dist = delay_dists.get(sim.fullname, lambda: 0)
+                sim.payoff_model = payoff_models.get(
+                    sim.fullname, uniform_payoffs)
+            for obj in itertools.chain(
+                    state['_sims'], state['scheds'], state['games'],
+                    state['profiles'], [state['folders']]):
+                if obj is not None:
+                    obj.server = self
+            for attr in _SNAPSHOT_ATTRS:
+                setattr(self, attr, state[attr])
+            with self._cache_lock:
+                self._cache.clear()
+                self._cached_bytes = 0
+            self._used = sum(nodes for nodes, _ in self._running.values())
+        for delay, fid in state['pending']:
+            self.sim_queue.put_nowait((now + delay, fid))
+
+    def advance(self, seconds):
+        """Advance virtual time, completing every simulation that's due"""
+        assert self._virtual_time, "can't advance time that isn't virtual"
+        assert seconds >= 0, "can't go back in time"
+        self._now += seconds
+        self._complete_due()
 
     def get_sim_instance(self, sim_id, configuration):
-        """Get the sim instance id for a sim and conf"""
-        return self._sim_insts.setdefault(
-            (sim_id, frozenset(configuration.items())),
-            (len(self._sim_insts), {}))
+        """Get the sim instance for a sim and conf"""
+        key = (sim_id, frozenset(configuration.items()))
+        inst = self._sim_insts.get(key)
+        if inst is None:
+            inst = _SimInstance(len(self._sim_insts))
+            self._sim_insts[key] = inst
+        return inst
 
     def _get_symgrp_id(self, symgrp):
         """Get symgroup id"""
@@ -141,6 +400,123 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
                 symgroups.append((self._get_symgrp_id(rsc),) + rsc)
         return symgroups
 
+    def add_folders(self, prof, num, state):
+        """Create `num` folders for observations of a profile at once
+
+        The new folders aren't inserted into the sorted indices, so
+        `sort_folders` must be called after all bulk additions."""
+        start = len(self.folders)
+        self.folders.extend(prof, num, state, self._next_job)
+        self._next_job += num
+        for fids in self._folder_index.values():
+            fids.extend(range(start, start + num))
+        self._job_index.extend(range(start, start + num))
+
+    def sort_folders(self):
+        """Resort the folder indices after bulk additions"""
+        for column, fids in self._folder_index.items():
+            values = {}
+            for fid in fids:
+                pid = self.folders.profs[fid]
+                if pid not in values:
+                    values[pid] = getattr(self.folders[fid], column)
+            self._folder_index[column] = array.array('l', sorted(
+                fids, key=lambda fid, vals=values: (
+                    vals[self.folders.profs[fid]], fid)))
+
+    def add_folder(self, prof):
+        """Create a new folder for an observation of a profile"""
+        obs = self.folders.append(prof)
+        for column, fids in self._folder_index.items():
+            key = getattr(obs, column), obs.id
+            low, high = 0, len(fids)
+            while low < high:
+                mid = (low + high) // 2
+                if (getattr(self.folders[fids[mid]], column),
+                        fids[mid]) < key:
+                    low = mid + 1
+                else:
+                    high = mid
+            fids.insert(low, obs.id)
+        self._job_index.insert(self._num_unassigned, obs.id)
+        self._num_unassigned += 1
+        return obs
+
+    def _folder_ids(self, column):
+        """Get a sequence of folder ids sorted ascending by column"""
+        if column == 'job':
+            return self._job_index
+        return self._folder_index.get(column, range(len(self.folders)))
+
+    def _folder_page(self, column, desc, start, stop):
+        """Get a page of folders without building the whole sorted order"""
+        num = len(self.folders)
+        if desc:
+            start, stop = max(num - stop, 0), max(num - start, 0)
+        else:
+            start, stop = min(start, num), min(stop, num)
+        fids = self._folder_ids(column)[start:stop]
+        folders = [self.folders[fid] for fid in fids]
+        return folders[::-1] if desc else folders
+
+    def record_request(self, method, route, resp):
+        """Count a handled request and the bytes in its response"""
+        size = (resp.raw.getbuffer().nbytes
+                if isinstance(resp.raw, io.BytesIO) else 0)
+        with self._stats_lock:
+            self.request_counts[method, route] += 1
+            self.request_bytes[method, route] += size
+
+    def get_request_counts(self):
+        """Get a copy of the request counts"""
+        with self._stats_lock:
+            return dict(self.request_counts)
+
+    def request_stats(self, method, route):
+        """Get the number of requests and bytes served that match a method
+        and route, either of which can be None to match anything"""
+        with self._stats_lock:
+            keys = [key for key in self.request_counts
+                    if (method is None or key[0] == method) and
+                    (route is None or key[1] == route)]
+            return (sum(self.request_counts[key] for key in keys),
+                    sum(self.request_bytes[key] for key in keys))
+
+    def reset_requests(self):
+        """Reset request accounting"""
+        with self._stats_lock:
+            self.request_counts.clear()
+            self.request_bytes.clear()
+
+    def _cached_resp(self, key, revision, func):
+        """Construct a response whose text is cached until revision changes
+
+        `func` returns the text of the response, and is only called if the
+        cached text is missing or from a different revision. The least
+        recently used text is evicted once the cache has more than
+        `cache_size` characters."""
+        with self._cache_lock:
+            entry = self._cache.get(key)
+            if entry is not None and entry[0] == revision:
+                self._cache.move_to_end(key)
+                return _resp(entry[1])
+        text = func()
+        with self._cache_lock:
+            old = self._cache.pop(key, None)
+            if old is not None:
+                self._cached_bytes -= len(old[1])
+            if len(text) <= self._cache_size:
+                self._cache[key] = revision, text
+                self._cached_bytes += len(text)
+            while self._cached_bytes > self._cache_size:
+                _, (_, evicted) = self._cache.popitem(last=False)
+                self._cached_bytes -= len(evicted)
+        return _resp(text)
+
+    def get_scheduler(self, sid):
+        """Get a scheduler"""
+        return self._get_sched(sid)
+
     def _get_sim(self, sid):
         """Get simulator"""
         assert 0 <= sid < len(self._sims) and self._sims[sid] is not None, \
@@ -171,17 +547,46 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
             "game with id '{:d}' doesn't exist".format(gid)
         return self.games[gid]
 
-    def create_simulator(self, name, version, email, conf, delay_dist): # pylint: disable=too-many-arguments
+    def create_simulator( # pylint: disable=too-many-arguments
+            self, name, version, email, conf, delay_dist, payoff_model,
+            failure_rate, role_conf):
         """Create a simulator"""
         assert version not in self._sims_by_name.get(name, {}), \
             'name already exists'
+        assert 0 <= failure_rate < 1, 'failure rate must be in [0, 1)'
         sim_id = len(self._sims)
         sim = _Simulator(self, sim_id, name, version, email, conf,
-                         delay_dist)
+                         delay_dist, payoff_model, failure_rate)
+        for role, strats in role_conf.items():
+            sim.role_conf[role] = sorted(set(strats))
         self._sims.append(sim)
         self._sims_by_name.setdefault(name, {})[version] = sim
         return sim_id
 
+    def create_scheduler( # pylint: disable=too-many-arguments
+            self, sim_id, name, size, obs_per_sim, time_per_obs,
+            process_memory, active, nodes, conf):
+        """Create a generic scheduler"""
+        assert name not in self.scheds_by_name, \
+            'scheduler named {} already exists'.format(name)
+        sim = self._get_sim(sim_id)
+        sched = _Scheduler(
+            sim, len(self.scheds), name, size, obs_per_sim, time_per_obs,
+            process_memory, active, nodes, conf)
+        self.scheds.append(sched)
+        self.scheds_by_name[name] = sched
+        return sched
+
+    def create_game(self, sim_id, name, size, conf):
+        """Create a game"""
+        assert name not in self.games_by_name, \
+            "game named '{}' already exists".format(name)
+        sim = self._get_sim(sim_id)
+        game = _Game(sim, len(self.games), name, size, conf)
+        self.games.append(game)
+        self.games_by_name[name] = game
+        return game
+
     def custom_response(self, func, times):
         """Return a custom response"""
         self._custom_func = func
@@ -208,13 +613,18 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
     @_matcher('GET', 'api/v3/simulators')
     def _simulator_all(self):
         """Get simulation creation"""
-        return _json_resp({'simulators': [
-            sim.get_all() for sim in self._sims if sim is not None]})
+        sims = [sim for sim in self._sims if sim is not None]
+        return self._cached_resp(
+            ('simulators',), _revisions(sims), lambda: json.dumps({
+                'simulators': [sim.get_all() for sim in sims]}))
 
     @_matcher('GET', r'api/v3/simulators/(\d+).json')
     def _simulator_get(self, sid):
         """Get simulator"""
-        return _json_resp(self._get_sim(int(sid)).get_info())
+        sim = self._get_sim(int(sid))
+        return self._cached_resp(
+            ('simulator', sim.id), sim.revision,
+            lambda: json.dumps(sim.get_info()))
 
     @_matcher('POST', r'api/v3/simulators/(\d+)/add_role.json')
     def _simulator_add_role(self, sid, role):
@@ -243,37 +653,36 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
     @_matcher('POST', 'api/v3/generic_schedulers')
     def _scheduler_create(self, scheduler):
         """Create scheduler"""
-        name = scheduler['name']
-        assert name not in self.scheds_by_name, \
-            'scheduler named {} already exists'.format(name)
-        sim = self._get_sim(int(scheduler['simulator_id']))
-        conf = scheduler.get('configuration', {})
-
-        sched_id = len(self.scheds)
-        sched = _Scheduler(
-            sim, sched_id, name, int(scheduler['size']),
+        sched = self.create_scheduler(
+            int(scheduler['simulator_id']), scheduler['name'],
+            int(scheduler['size']),
             int(scheduler['observations_per_simulation']),
             int(scheduler['time_per_observation']),
             int(scheduler['process_memory']),
             bool(int(scheduler['active'])), int(scheduler['nodes']),
-            conf)
-        self.scheds.append(sched)
-        self.scheds_by_name[name] = sched
+            scheduler.get('configuration', {}))
         return _json_resp(sched.get_info())
 
     @_matcher('GET', 'api/v3/generic_schedulers')
     def _scheduler_all(self):
         """Get scheduler creation"""
-        return _json_resp({'generic_schedulers': [
-            s.get_info() for s in self.scheds if s is not None]})
+        scheds = [s for s in self.scheds if s is not None]
+        return self._cached_resp(
+            ('schedulers',), _revisions(scheds), lambda: json.dumps({
+                'generic_schedulers': [s.get_info() for s in scheds]}))
 
     @_matcher('GET', r'api/v3/schedulers/(\d+).json')
     def _scheduler_get(self, sid, granularity=None):
         """Get scheduler"""
         sched = self._get_sched(int(sid))
-        return _json_resp(sched.get_requirements()
-                          if granularity == 'with_requirements'
-                          else sched.get_info())
+        if granularity == 'with_requirements':
+            return self._cached_resp(
+                ('requirements', sched.id), sched.data_revision,
+                lambda: json.dumps(sched.get_requirements()))
+        else:
+            return self._cached_resp(
+                ('scheduler', sched.id), sched.revision,
+                lambda: json.dumps(sched.get_info()))
 
     @_matcher('PUT', r'api/v3/generic_schedulers/(\d+).json')
     def _scheduler_update(self, sid, scheduler):
@@ -316,67 +725,74 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
         """Get profile"""
         prof = self._get_prof(int(pid))
         if granularity == 'structure':
-            return _json_resp(prof.get_structure())
+            func = prof.get_structure
         elif granularity == 'summary':
-            return _json_resp(prof.get_summary())
+            func = prof.get_summary
         elif granularity == 'observations':
-            return _json_resp(prof.get_observations())
+            func = prof.get_observations
         elif granularity == 'full':
-            return _json_resp(prof.get_full())
+            func = prof.get_full
         else:
             raise AssertionError('should never get here') # pragma: no cover
+        return self._cached_resp(
+            ('profile', prof.id, granularity), prof.revision,
+            lambda: json.dumps(func()))
 
     @_matcher('GET', 'simulations')
     def _simulation_all(
             self, direction='DESC', page='1', sort='job_id', search=''):
         """Get simulation creation"""
-        assert isinstance(search, str)
         desc = direction == 'DESC'
         assert sort in _SIM_KEYS, 'unknown sort key'
         column = _SIM_KEYS[sort]
-        if column in {'folder', 'profile', 'simulator'}:
-            sims = sorted(self.folders, key=lambda f: getattr(f, column),
-                          reverse=desc)
-        elif desc:
-            sims = self.folders[::-1]
-        else:
-            sims = self.folders
-
+        filters = _parse_search(search)
         page = int(page)
-        sims = sims[25 * (page - 1): 25 * page]
-
-        if not sims: # pylint: disable=no-else-return
-            return _html_resp()
-        else:
-            return _html_resp(
-                '<tbody>' + '\n'.join(f.get_all() for f in sims) + '</tbody>')
+        start, stop = 25 * (page - 1), 25 * page
+
+        def page_html():
+            """Render the page of simulations"""
+            if filters:
+                fids = self._folder_ids(column)
+                sims = list(itertools.islice(
+                    (self.folders[fid] for fid
+                     in (reversed(fids) if desc else fids)
+                     if self.folders[fid].matches(filters)),
+                    start, stop))
+            else:
+                sims = self._folder_page(column, desc, start, stop)
+            if not sims:
+                return _html()
+            return _html('<tbody>' + '\n'.join(f.get_all() for f in sims) +
+                         '</tbody>')
+
+        return self._cached_resp(
+            ('simulations', column, desc, page, tuple(filters)),
+            self.folders.revision, page_html)
 
     @_matcher('GET', r'simulations/(\d+)')
     def _simulation_get(self, fid):
         """Get simulation"""
-        return _html_resp(self._get_folder(int(fid)).get_info())
+        folder = self._get_folder(int(fid))
+        return self._cached_resp(
+            ('simulation', folder.id), folder.revision,
+            lambda: _html(folder.get_info()))
 
     @_matcher('POST', 'games')
     def _game_create(self, auth_token, game, selector):
         """Game create"""
         assert isinstance(auth_token, str)
-        name = game['name']
-        assert name not in self.games_by_name, \
-            "game named '{}' already exists".format(name)
-        sim = self._get_sim(int(selector['simulator_id']))
-        conf = selector.get('configuration', {})
-
-        game_id = len(self.games)
-        game = _Game(sim, game_id, name, int(game['size']), conf)
-        self.games.append(game)
-        self.games_by_name[name] = game
-        return _html_resp('<div id=game_{:d}></div>'.format(game_id))
+        game = self.create_game(
+            int(selector['simulator_id']), game['name'], int(game['size']),
+            selector.get('configuration', {}))
+        return _html_resp('<div id=game_{:d}></div>'.format(game.id))
 
     @_matcher('GET', 'api/v3/games')
     def _game_all(self):
         """Get game creation"""
-        return _json_resp({'games': [
-            game.get_all() for game in self.games if game is not None]})
+        games = [game for game in self.games if game is not None]
+        return self._cached_resp(
+            ('games',), _revisions(games), lambda: json.dumps({
+                'games': [game.get_all() for game in games]}))
 
     @_matcher('GET', r'games/(\d+).json')
     def _game_get(self, gid, granularity='structure'):
@@ -384,15 +800,20 @@ class _ServerData(requests_mock.Mocker): # pylint: disable=too-many-instance-att
         game = self._get_game(int(gid))
         if granularity == 'structure':
             # This extra dump is a quirk of the api
-            return _json_resp(json.dumps(game.get_structure()))
+            return self._cached_resp(
+                ('game', game.id, granularity), game.revision,
+                lambda: json.dumps(json.dumps(game.get_structure())))
         elif granularity == 'summary':
-            return _json_resp(game.get_summary())
+            func = game.get_summary
         elif granularity == 'observations':
-            return _json_resp(game.get_observations())
+            func = game.get_observations
         elif granularity == 'full':
-            return _json_resp(game.get_full())
+            func = game.get_full
         else:
             raise AssertionError('should never get here') # pragma: no cover
+        return self._cached_resp(
+            ('game', game.id, granularity), game.data_revision,
+            lambda: json.dumps(func()))
 
     @_matcher('POST', r'api/v3/games/(\d+)/add_role.json')
     def _game_add_role(self, gid, role, count):
@@ -439,8 +860,12 @@ class _Server(object):
 
     Supports creating simulators and throwing exceptions.
     """
-    def __init__(self, domain, **kwargs):
-        self._data = _ServerData(domain, **kwargs)
+    def __init__( # pylint: disable=too-many-arguments
+            self, domain, virtual_time, auto_advance, seed, slots,
+            node_memory, queue_policy, scoped, cache_size, **kwargs):
+        self._data = _ServerData(
+            domain, virtual_time, auto_advance, seed, slots, node_memory,
+            queue_policy, scoped, cache_size, **kwargs)
 
     async def __aenter__(self):
         await self._data.__aenter__()
@@ -449,18 +874,125 @@ class _Server(object):
     async def __aexit__(self, typ, value, traceback):
         await self._data.__aexit__(typ, value, traceback)
 
+    @property
+    def domain(self):
+        """The domain this server mocks"""
+        return self._data.domain
+
+    def session(self):
+        """Create a requests session that's handled by this server
+
+        This is necessary to talk to a scoped server, but also works when the
+        server patches requests globally."""
+        sess = _ScopedSession()
+        sess.mount('https://{}'.format(self._data.domain), self._data.adapter)
+        return sess
+
+    def api(self, auth_token='', **kwargs):
+        """Create an api that talks to this server
+
+        Keyword arguments are passed to `egtaonline.api.api`."""
+        return api.api(auth_token, domain=self._data.domain,
+                       session_factory=self.session, **kwargs)
+
     def create_simulator( # pylint: disable=too-many-arguments
             self, name, version, email='egta@mailinator.com', conf=None,
-            delay_dist=lambda: 0):
+            delay_dist=lambda: 0, payoff_model=None, failure_rate=0.0,
+            role_conf=None):
         """Create a simulator
 
         Parameters
         ----------
         delay_dist : () -> float
             Generator of how long simulations take to complete in seconds.
+        payoff_model : (rng, [(role, strategy, count)], num) -> [float]
+            Generator of payoffs for a batch of observations. It's called
+            with the server's random number generator, the symmetry groups of
+            the profile, and the number of observations. It must return the
+            payoff of every player for every observation, in order by
+            observation, then symmetry group. By default payoffs are uniform
+            on [0, 1). See `strategy_payoffs` and `congestion_payoffs` for
+            other models.
+        failure_rate : float, optional
+            The probability that a simulation fails when it finishes. Failed
+            simulations are replaced by a new queued simulation of the same
+            profile.
+        role_conf : {role: [strategy]}, optional
+            Roles and strategies to create the simulator with.
+        """
+        with self._data.lock.write():
+            return self._data.create_simulator(
+                name, version, email, conf or {}, delay_dist,
+                payoff_model or uniform_payoffs, failure_rate,
+                role_conf or {})
+
+    def create_scheduler( # pylint: disable=too-many-arguments
+            self, sim_id, name, role_counts, active=True,
+            process_memory=4096, time_per_observation=300,
+            observations_per_simulation=1, nodes=1, conf=None):
+        """Create a generic scheduler directly
+
+        This skips requests entirely, and is intended for building large
+        fixtures quickly. See `api.create_generic_scheduler` for a description
+        of the parameters.
+
+        Parameters
+        ----------
+        role_counts : {role: count}
+            The number of players in each role of the scheduler.
+        """
+        with self._data.lock.write():
+            sched = self._data.create_scheduler(
+                sim_id, name, sum(role_counts.values()),
+                observations_per_simulation, time_per_observation,
+                process_memory, active, nodes, conf or {})
+            for role, count in role_counts.items():
+                sched.add_role(role, count)
+            return sched.id
+
+    def add_profiles(self, sched_id, assignments, observations=0):
+        """Add profiles with completed observations to a scheduler directly
+
+        Parameters
+        ----------
+        sched_id : int
+            The scheduler to add profiles to.
+        assignments : [str or list]
+            Assignment strings or symmetry group lists for each profile.
+        observations : int, optional
+            The requirement for each profile. This many observations are
+            completed immediately without being scheduled.
+
+        Returns
+        -------
+        The ids of every profile in the order they were specified.
+        """
+        with self._data.lock.write():
+            sched = self._data.get_scheduler(sched_id)
+            prof_ids = [
+                sched.seed_profile(
+                    assign if isinstance(assign, str)
+                    else symgrps_to_assignment(assign), observations).id
+                for assign in assignments]
+            self._data.sort_folders()
+            return prof_ids
+
+    def create_game(self, sim_id, name, symgrps, conf=None):
+        """Create a game directly
+
+        Parameters
+        ----------
+        symgrps : [(role, count, [strategy])]
+            The symmetry groups of the game.
         """
-        return self._data.create_simulator(
-            name, version, email, conf or {}, delay_dist)
+        with self._data.lock.write():
+            game = self._data.create_game(
+                sim_id, name, sum(c for _, c, _ in symgrps), conf or {})
+            for role, count, strats in symgrps:
+                game.add_role(role, count)
+                for strat in strats:
+                    game.add_strategy(role, strat)
+            return game.id
 
     def custom_response(self, func, times=1):
         """Return a custom response.
@@ -471,6 +1003,117 @@ class _Server(object):
         """
         return self._data.custom_response(func, times)
 
+    def request_counts(self):
+        """Get the number of requests handled by method and route
+
+        Returns
+        -------
+        counts : {(method, route): int}
+            Routes are the names of the mock handlers, e.g. `game_get` for
+            fetching game data, or `scheduler_add_profile`.
+        """
+        return self._data.get_request_counts()
+
+    def request_count(self, method=None, route=None):
+        """Get the number of requests handled
+
+        Parameters
+        ----------
+        method : str, optional
+            Only count requests with this http method, e.g. 'GET'.
+        route : str, optional
+            Only count requests to this route.
+        """
+        return self._data.request_stats(method, route)[0]
+
+    def bytes_served(self, method=None, route=None):
+        """Get the total size of response bodies, filtered like
+        `request_count`"""
+        return self._data.request_stats(method, route)[1]
+
+    def reset_requests(self):
+        """Reset request and byte counts to zero"""
+        self._data.reset_requests()
+
+    @contextlib.contextmanager
+    def request_budget(self, budget, method=None, route=None):
+        """Assert that a block makes at most `budget` requests
+
+        Requests are filtered like `request_count`. This raises an
+        AssertionError with the requests that were made if the budget is
+        exceeded.
+
+        Examples
+        --------
+        >>> with server.request_budget(1):
+        ...     await egta.get_canon_game(sim_id, symgrps)
+        """
+        before = collections.Counter(self.request_counts())
+        yield
+        made = collections.Counter(self.request_counts())
+        made.subtract(before)
+        made = {key: count for key, count in made.items()
+                if count > 0 and (method is None or key[0] == method) and
+                (route is None or key[1] == route)}
+        total = sum(made.values())
+        assert total <= budget, \
+            'made {:d} requests with a budget of {:d}: {}'.format(
+                total, budget, ', '.join(
+                    '{} {} x{:d}'.format(meth, rte, count)
+                    for (meth, rte), count in sorted(made.items())))
+
+    def cancel_simulation(self, folder):
+        """Cancel a queued or running simulation
+
+        Canceled simulations free their nodes and are never completed, nor
+        replaced by another simulation."""
+        with self._data.lock.write():
+            self._data.cancel(folder)
+
+    def dump(self, fil):
+        """Write a snapshot of the server to a binary file
+
+        Snapshots include every simulator, scheduler, game, profile, and
+        observation, including simulations that haven't completed yet."""
+        self._data.dump(fil)
+
+    def load(self, fil, delay_dists=None, payoff_models=None):
+        """Load a snapshot from a binary file into a server with no data
+
+        Parameters
+        ----------
+        fil : file
+            A binary file with a snapshot written by `dump`.
+        delay_dists : {str: () -> float}, optional
+            Delay distributions can't be saved in a snapshot, so this maps
+            simulator fullnames to the delay distribution they should use. By
+            default simulations complete instantly.
+        payoff_models : {str: payoff_model}, optional
+            Like `delay_dists` but for the payoff model of each simulator. By
+            default payoffs are uniform.
+        """
+        self._data.load(fil, delay_dists or {}, payoff_models or {})
+
+    def advance(self, seconds):
+        """Advance virtual time by `seconds`
+
+        Every simulation that finishes within that time is completed at once.
+        This is only valid if the server was created with `virtual_time`."""
+        self._data.advance(seconds)
+
+
+# Captured at import so scoped sessions can bypass global mocks
+_SESSION_SEND = requests.Session.send
+
+
+class _ScopedSession(requests.Session):
+    """A session that only uses its mounted adapters
+
+    Unscoped servers patch `requests.Session.send` to handle every request,
+    this ignores that so scoped servers work while one is active."""
+    def send(self, request, **kwargs): # pylint: disable=arguments-differ
+        return _SESSION_SEND(self, request, **kwargs)
+
 
 def _dict(item, keys, **extra):
     """Convert item to dict"""
@@ -491,9 +1134,19 @@ def _json_resp(json_data):
     return _resp(json.dumps(json_data))
 
 
+def _html(body=''):
+    """Wrap body in an html document"""
+    return '<html><head></head><body>{}</body></html>'.format(body)
+
+
 def _html_resp(body=''):
     """Construct a response with various data types"""
-    return _resp('<html><head></head><body>{}</body></html>'.format(body))
+    return _resp(_html(body))
+
+
+def _revisions(items):
+    """The combined revision of a list of server objects"""
+    return tuple((item.id, item.revision) for item in items)
 
 
 def _decode_data(text):
@@ -518,11 +1171,88 @@ _SIM_KEYS = {
     'id': 'folder',
     'job_id': 'job',
 }
+_SEARCH_KEYS = frozenset(_SIM_KEYS.values())
+_SEARCH_SUBSTRING = frozenset(['profile', 'simulator'])
+_SEARCH_TERM = re.compile(r'(\w+)="([^"]*)"')
+
+
+def _parse_search(search):
+    """Parse an egta search string into (column, value) filters
+
+    Searches are space separated `key="value"` terms. Profiles and simulators
+    match on substrings, every other key must match exactly."""
+    assert isinstance(search, str)
+    assert not _SEARCH_TERM.sub('', search).strip(), \
+        "couldn't parse search string '{}'".format(search)
+    filters = _SEARCH_TERM.findall(search)
+    for key, _ in filters:
+        assert key in _SEARCH_KEYS, "unknown search key '{}'".format(key)
+    return filters
+
+
+_SNAPSHOT_VERSION = 2
+_SNAPSHOT_ATTRS = (
+    '_sims', '_sims_by_name', 'scheds', 'scheds_by_name', 'games',
+    'games_by_name', '_sim_insts', '_symgrps_tup', 'profiles', 'folders',
+    '_folder_index', 'rng', '_job_index', '_num_unassigned', '_next_job',
+    '_queued', '_running')
+
+
+class _Detached(object): # pylint: disable=too-few-public-methods
+    """Base for server objects that can be saved in a snapshot
+
+    Attributes in `_transient`, like the reference to the server, aren't
+    pickled and need to be restored by the server when loading. Every object
+    also has a revision that's incremented whenever it's modified, so
+    responses can be cached until it changes."""
+    _transient = ('server',)
+    revision = 0
+
+    def touch(self):
+        """Mark the object as updated"""
+        self.updated_at = _get_time_str()
+        self.revision += 1
+
+    def __getstate__(self):
+        return {key: val for key, val in self.__dict__.items()
+                if key not in self._transient}
+
 
+class _SimInstance(object):
+    """A simulator instance
 
-class _Simulator(object): # pylint: disable=too-many-instance-attributes
+    All schedulers and games with the same simulator and configuration share
+    profiles through their simulator instance. Profiles with data are indexed
+    by role and strategy so games can find the profiles they contain without
+    scanning the whole instance. The revision is incremented whenever any
+    profile in the instance gets new data."""
+    revision = 0
+
+    def __init__(self, iid):
+        self.id = iid # pylint: disable=invalid-name
+        self.assignments = {}
+        self.games = set()
+        self._index = {}
+
+    def add_data(self, prof):
+        """Index a profile that just got its first observation"""
+        for _, role, strat, _ in prof.symgrps:
+            self._index.setdefault((role, strat), {})[prof.id] = prof
+        for game in self.games:
+            game.check_profile(prof)
+
+    def with_strategy(self, role, strat):
+        """Get all profiles with data that contain role and strategy"""
+        return self._index.get((role, strat), {}).values()
+
+
+class _Simulator(_Detached): # pylint: disable=too-many-instance-attributes
     """Simulator"""
-    def __init__(self, serv, sid, name, version, email, conf, delay_dist): # pylint: disable=too-many-arguments
+    _transient = ('server', 'delay_dist', 'payoff_model')
+
+    def __init__( # pylint: disable=too-many-arguments
+            self, serv, sid, name, version, email, conf, delay_dist,
+            payoff_model, failure_rate):
         self.server = serv
         self.id = sid # pylint: disable=invalid-name
         self.name = name
@@ -536,6 +1266,8 @@ class _Simulator(object): # pylint: disable=too-many-instance-attributes
         self.created_at = current_time
         self.updated_at = current_time
         self.delay_dist = delay_dist
+        self.payoff_model = payoff_model
+        self.failure_rate = failure_rate
         self._source = '/uploads/simulator/source/{:d}/{}.zip'.format(
             self.id, self.name)
         self.url = 'https://{}/simulators/{:d}'.format(
@@ -560,24 +1292,24 @@ class _Simulator(object): # pylint: disable=too-many-instance-attributes
     def add_role(self, role):
         """Add role"""
         self.role_conf.setdefault(role, [])
-        self.updated_at = _get_time_str()
+        self.touch()
 
     def remove_role(self, role):
         """Remove role"""
         if self.role_conf.pop(role, None) is not None:
-            self.updated_at = _get_time_str()
+            self.touch()
 
     def add_strategy(self, role, strat):
         """Add strategy"""
         strats = self.role_conf[role]
         strats.insert(bisect.bisect_left(strats, strat), strat)
-        self.updated_at = _get_time_str()
+        self.touch()
 
     def remove_strategy(self, role, strategy):
         """Remove strategy"""
         try:
             self.role_conf[role].remove(strategy)
-            self.updated_at = _get_time_str()
+            self.touch()
         except (KeyError, ValueError):
             pass  # don't care
 
@@ -596,7 +1328,7 @@ class _Simulator(object): # pylint: disable=too-many-instance-attributes
              'role_configuration', 'source', 'updated_at', 'url', 'version'])
 
 
-class _Scheduler(object): # pylint: disable=too-many-instance-attributes
+class _Scheduler(_Detached): # pylint: disable=too-many-instance-attributes
     """A scheduler"""
     def __init__( # pylint: disable=too-many-arguments
             self, sim, sid, name, size, obs_per_sim, time_per_obs,
@@ -608,8 +1340,8 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
         self.default_observation_requirement = 0
         self.observations_per_simulation = obs_per_sim
         self.process_memory = process_memory
-        self.simulator_instance_id, self._assignments = (
-            sim.server.get_sim_instance(sim.id, conf))
+        self._inst = sim.server.get_sim_instance(sim.id, conf)
+        self.simulator_instance_id = self._inst.id
         self.size = size
         self.time_per_observation = time_per_obs
         current_time = _get_time_str()
@@ -649,11 +1381,11 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
             kwargs['active'] = bool(kwargs['active'])
         if not self.active and kwargs['active']:
             for prof, count in self._reqs.items():
-                prof.update(count)
+                prof.update(count, self.nodes, self.process_memory)
         # FIXME Only for valid keys
         for key, val in kwargs.items():
             setattr(self, key, val)
-        self.updated_at = _get_time_str()
+        self.touch()
 
     def add_role(self, role, count):
         """Add role"""
@@ -661,12 +1393,12 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
         assert role not in self.role_conf
         assert sum(self.role_conf.values()) + count <= self.size
         self.role_conf[role] = count
-        self.updated_at = _get_time_str()
+        self.touch()
 
     def remove_role(self, role):
         """Remove a role from the scheduler"""
         if self.role_conf.pop(role, None) is not None:
-            self.updated_at = _get_time_str()
+            self.touch()
 
     def destroy(self):
         """Destroy scheduler"""
@@ -674,6 +1406,11 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
         self.server.scheds[self.id] = None
         self._destroyed = True
 
+    @property
+    def data_revision(self):
+        """Revision of the scheduler and the profiles it could contain"""
+        return self.revision, self._inst.revision
+
     def get_info(self):
         """Get info"""
         return _dict(
@@ -694,17 +1431,25 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
 
     def get_profile(self, assignment):
         """Get profile"""
-        if assignment in self._assignments:
-            return self._assignments[assignment]
+        if assignment in self._inst.assignments:
+            return self._inst.assignments[assignment]
         prof_id = len(self.server.profiles)
-        prof = _Profile(self.sim, prof_id, assignment,
-                        self.simulator_instance_id)
+        prof = _Profile(self.sim, prof_id, assignment, self._inst)
         for _, role, strat, _ in prof.symgrps:
             assert role in self.role_conf
             assert strat in self.sim.role_conf[role]
         assert prof.role_conf == self.role_conf
         self.server.profiles.append(prof)
-        self._assignments[assignment] = prof
+        self._inst.assignments[assignment] = prof
+        return prof
+
+    def seed_profile(self, assignment, count):
+        """Add a profile with `count` completed observations"""
+        prof = self.get_profile(assignment)
+        assert prof not in self._reqs, 'profile already in scheduler'
+        self._reqs[prof] = count
+        self.revision += 1
+        prof.seed(max(count - prof.observations_count, 0))
         return prof
 
     def add_profile(self, assignment, count):
@@ -714,9 +1459,9 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
         if prof not in self._reqs:
             # This is how egta online behaves, but it seems non ideal
             self._reqs[prof] = count
-            self.updated_at = _get_time_str()
+            self.touch()
             if self.active:
-                prof.update(count)
+                prof.update(count, self.nodes, self.process_memory)
 
         return prof
 
@@ -725,36 +1470,41 @@ class _Scheduler(object): # pylint: disable=too-many-instance-attributes
         try:
             prof = self.server.profiles[pid]
             if self._reqs.pop(prof, None) is not None:
-                self.updated_at = _get_time_str()
+                self.touch()
         except IndexError:
             pass  # don't care
 
 
-class _Profile(object): # pylint: disable=too-many-instance-attributes
+class _Profile(_Detached): # pylint: disable=too-many-instance-attributes
     """A profile"""
-    def __init__(self, sim, pid, assignment, inst_id):
+    def __init__(self, sim, pid, assignment, inst):
         self.id = pid # pylint: disable=invalid-name
         self.assignment = assignment
-        self.simulator_instance_id = inst_id
+        self.simulator_instance_id = inst.id
         current_time = _get_time_str()
         self.created_at = current_time
         self.updated_at = current_time
 
         self.sim = sim
         self.server = sim.server
+        self.inst = inst
         self.symgrps = self.server.assign_to_symgrps(assignment)
         self.role_conf = collections.Counter()
         for _, role, _, count in self.symgrps:
             self.role_conf[role] += count
         self.size = sum(self.role_conf.values())
-        self.obs = []
+        self.observations_count = 0
+        # Payoffs of every completed observation are stored contiguously
+        # with the symmetry group of each player in `_gids`, and the mean
+        # payoff of each symmetry group for every observation in `_means`
+        self._gids = array.array('l', itertools.chain.from_iterable(
+            itertools.repeat(gid, count) for gid, _, _, count
+            in self.symgrps))
+        self._pays = array.array('d')
+        self._means = array.array('d')
+        self._stats = {gid: [0, 0.0, 0.0] for gid, _, _, _ in self.symgrps}
         self._scheduled = 0
 
-    @property
-    def observations_count(self):
-        """Observations count"""
-        return len(self.obs)
-
     @property
     def current_count(self):
         """Current count"""
@@ -771,19 +1521,57 @@ class _Profile(object): # pylint: disable=too-many-instance-attributes
         return [{'id': gid, 'role': role, 'strategy': strat, 'count': count}
                 for gid, role, strat, count in self.symgrps]
 
-    def update(self, count):
-        """Update count requested"""
+    def update(self, count, nodes, memory):
+        """Update count requested, scheduling simulations that need `nodes`
+        nodes with `memory` MB of memory each"""
         if self._scheduled < count:
-            self.updated_at = _get_time_str()
+            self.touch()
         for _ in range(count - self._scheduled):
-            folder = len(self.server.folders)
-            obs = _Observation(self, folder)
-            self.server.folders.append(obs)
-            sim_time = time.time() + self.sim.delay_dist()
-            self.server.loop.call_soon_threadsafe(
-                self.server.sim_queue.put_nowait, (sim_time, obs.id, obs))
+            self.server.submit(self, nodes, memory)
             self._scheduled += 1
 
+    def add_observations(self, num=1):
+        """Add simulated observations and update the running statistics
+
+        Payoffs for all of the observations are generated at once."""
+        pays = self.sim.payoff_model(
+            self.server.rng, [sym[1:] for sym in self.symgrps], num)
+        assert len(pays) == num * self.size, \
+            'payoff model returned the wrong number of payoffs'
+        start = len(self._pays)
+        self._pays.extend(pays)
+        for ind in range(start, len(self._pays), self.size):
+            sums = dict.fromkeys(self._stats, 0.0)
+            for gid, pay in zip(self._gids,
+                                self._pays[ind:ind + self.size]):
+                _update_stats(self._stats[gid], pay)
+                sums[gid] += pay
+            self._means.extend(sums[gid] / count for gid, _, _, count
+                               in self.symgrps)
+        first = not self.observations_count
+        self.observations_count += num
+        self.revision += 1
+        self.inst.revision += 1
+        if first and num:
+            self.inst.add_data(self)
+
+    def seed(self, num):
+        """Add `num` completed observations without scheduling them"""
+        self.server.add_folders(self, num, 'complete')
+        self._scheduled += num
+        self.add_observations(num)
+
+    def _observation_pays(self, ind):
+        """Get the player payoffs of an observation"""
+        return zip(self._gids,
+                   self._pays[ind * self.size:(ind + 1) * self.size])
+
+    def _observation_means(self, ind):
+        """Get the symmetry group means of an observation"""
+        num = len(self.symgrps)
+        return zip((gid for gid, _, _, _ in self.symgrps),
+                   self._means[ind * num:(ind + 1) * num])
+
     def get_new(self):
         """Newly created data"""
         return _dict(
@@ -803,19 +1591,9 @@ class _Profile(object): # pylint: disable=too-many-instance-attributes
 
     def get_summary(self):
         """Summary data"""
-        if self.obs:
-            payoffs = {
-                gid: (mean, stddev)
-                for gid, mean, stddev
-                in _mean_id(itertools.chain.from_iterable(
-                    obs.pays for obs in self.obs))}
-        else:
-            payoffs = {gid: (None, None) for gid, _, _, _
-                       in self.symgrps}
-
         symgrps = []
         for gid, role, strat, count in self.symgrps:
-            pay, pay_sd = payoffs[gid]
+            pay, pay_sd = _stats_moments(self._stats[gid])
             symgrps.append({
                 'id': gid,
                 'role': role,
@@ -838,8 +1616,8 @@ class _Profile(object): # pylint: disable=too-many-instance-attributes
                 'id': sid,
                 'payoff': pay,
                 'payoff_sd': None,
-            } for sid, pay, _ in _mean_id(obs.pays)]
-        } for obs in self.obs]
+            } for sid, pay in self._observation_means(ind)]
+        } for ind in range(self.observations_count)]
         return _dict(
             self,
             ['id', 'simulator_instance_id', 'symmetry_groups'],
@@ -855,45 +1633,153 @@ class _Profile(object): # pylint: disable=too-many-instance-attributes
                 'f': {},
                 'p': pay,
                 'sid': sid,
-            } for sid, pay in obs.pays]
-        } for obs in self.obs]
+            } for sid, pay in self._observation_pays(ind)]
+        } for ind in range(self.observations_count)]
         return _dict(
             self,
             ['id', 'simulator_instance_id', 'symmetry_groups'],
             observations=observations)
 
 
-class _Observation(object): # pylint: disable=too-many-instance-attributes
-    """An observation"""
-    def __init__(self, prof, oid):
+class _Folders(_Detached):
+    """Columnar storage of every simulation folder
+
+    A folder only stores the id of its profile and a state code, observation
+    objects are light weight views that are created on demand."""
+    def __init__(self, serv):
+        self.server = serv
+        self.profs = array.array('l')
+        self.states = bytearray()
+        self.jobs = array.array('l')
+        self.errors = {}
+
+    def __len__(self):
+        return len(self.profs)
+
+    def set_state(self, fid, state, error=None):
+        """Set the state of a folder"""
+        self.states[fid] = _STATES.index(state)
+        if error is not None:
+            self.errors[fid] = error
+        self.revision += 1
+
+    def start(self, fid, job):
+        """Start running a folder as a job"""
+        self.jobs[fid] = job
+        self.set_state(fid, 'running')
+
+    def __getitem__(self, fid):
+        if not 0 <= fid < len(self.profs):
+            raise IndexError('folder index out of range')
+        return _Observation(self.server, fid)
+
+    def append(self, prof):
+        """Add a new queued folder for a profile"""
+        self.profs.append(prof.id)
+        self.states.append(_STATES.index('queued'))
+        self.jobs.append(0)
+        self.revision += 1
+        return _Observation(self.server, len(self.profs) - 1)
+
+    def extend(self, prof, num, state, job):
+        """Add `num` folders for a profile with the same state, and
+        consecutive jobs starting at `job`"""
+        self.profs.extend(itertools.repeat(prof.id, num))
+        self.states.extend(itertools.repeat(_STATES.index(state), num))
+        self.jobs.extend(range(job, job + num))
+        self.revision += 1
+
+
+# New states are added to the end so existing state codes don't change
+_STATES = ('running', 'complete', 'queued', 'failed', 'canceled')
+_QUEUE_POLICIES = frozenset(['fifo', 'backfill'])
+
+
+class _Observation(object):
+    """An observation
+
+    This is a view of a folder in the server's columnar folder storage."""
+    __slots__ = ('server', 'id')
+
+    def __init__(self, serv, oid):
+        self.server = serv
         self.id = oid # pylint: disable=invalid-name
-        self.folder = oid
-        self.folder_number = oid
-        self.job = 'Not specified'
-        self.profile = prof.assignment
-        self.simulator = prof.sim.fullname
-        self.simulator_fullname = self.simulator
-        self.simulator_instance_id = prof.simulator_instance_id
-        self.size = prof.size
-        self.error_message = ''
-
-        self._prof = prof
-        self.server = prof.server
-        self.pays = tuple(itertools.chain.from_iterable(
-            ((gid, random.random()) for _ in range(count))
-            for gid, _, _, count in prof.symgrps))
-        self._simulated = False
+
+    @property
+    def _prof(self):
+        """Profile of the observation"""
+        return self.server.profiles[self.server.folders.profs[self.id]]
+
+    @property
+    def folder(self):
+        """Folder"""
+        return self.id
+
+    @property
+    def folder_number(self):
+        """Folder number"""
+        return self.id
+
+    @property
+    def profile(self):
+        """Profile assignment"""
+        return self._prof.assignment
+
+    @property
+    def simulator(self):
+        """Simulator fullname"""
+        return self._prof.sim.fullname
+
+    @property
+    def simulator_fullname(self):
+        """Simulator fullname"""
+        return self.simulator
+
+    @property
+    def simulator_instance_id(self):
+        """Simulator instance id"""
+        return self._prof.simulator_instance_id
+
+    @property
+    def size(self):
+        """Size"""
+        return self._prof.size
 
     @property
     def state(self):
         """State"""
-        return 'complete' if self._simulated else 'running'
+        return _STATES[self.server.folders.states[self.id]]
+
+    @property
+    def job(self):
+        """Job id, if the simulation has started"""
+        return self.server.folders.jobs[self.id] or 'Not specified'
+
+    @property
+    def error_message(self):
+        """Error message"""
+        return self.server.folders.errors.get(self.id, '')
+
+    @property
+    def revision(self):
+        """Revision of the folder, which only changes with its state"""
+        return self.server.folders.states[self.id]
 
     def simulate(self):
         """Simulate the observation"""
-        assert not self._simulated
-        self._simulated = True
-        self._prof.obs.append(self)
+        assert self.state == 'running'
+        self.server.folders.set_state(self.id, 'complete')
+        self._prof.add_observations()
+
+    def matches(self, filters):
+        """Test if the observation matches parsed search filters"""
+        for column, value in filters:
+            if column in _SEARCH_SUBSTRING:
+                if value not in getattr(self, column):
+                    return False
+            elif str(getattr(self, column)) != value:
+                return False
+        return True
 
     def get_all(self):
         """Get standard data"""
@@ -901,7 +1787,7 @@ class _Observation(object): # pylint: disable=too-many-instance-attributes
             '<tr>' + ''.join(
                 '<td>{}</td>'.format(d) for d
                 in [self.state, self.profile, self.simulator, self.folder,
-                    'n/a'])
+                    self.server.folders.jobs[self.id] or 'n/a'])
             + '</tr>')
 
     def get_info(self):
@@ -916,13 +1802,13 @@ class _Observation(object): # pylint: disable=too-many-instance-attributes
             '</div>')
 
 
-class _Game(object): # pylint: disable=too-many-instance-attributes
+class _Game(_Detached): # pylint: disable=too-many-instance-attributes
     """A mock game"""
     def __init__(self, sim, gid, name, size, conf): # pylint: disable=too-many-arguments
         self.id = gid # pylint: disable=invalid-name
         self.name = name
-        self.simulator_instance_id, self._assignments = (
-            sim.server.get_sim_instance(sim.id, conf))
+        self._inst = sim.server.get_sim_instance(sim.id, conf)
+        self.simulator_instance_id = self._inst.id
         self.size = size
         current_time = _get_time_str()
         self.created_at = current_time
@@ -935,13 +1821,42 @@ class _Game(object): # pylint: disable=too-many-instance-attributes
         self.server = sim.server
         self._conf = conf
         self.role_conf = {}
+        self._profiles = {}
         self._destroyed = False
+        self._inst.games.add(self)
 
     @property
     def configuration(self):
         """Configuration"""
         return [[k, str(v)] for k, v in self._conf.items()]
 
+    def _matches(self, prof):
+        """Test if a profile is in this game"""
+        counts = collections.Counter()
+        for _, role, strat, count in prof.symgrps:
+            if strat not in self.role_conf.get(role, ((), 0))[0]:
+                return False
+            counts[role] += count
+        return all(counts[r] == c for r, (_, c) in self.role_conf.items())
+
+    def check_profile(self, prof):
+        """Add a profile to the game if it matches"""
+        if self._matches(prof):
+            self._profiles[prof.id] = prof
+
+    def _reindex(self):
+        """Recompute all profiles in the game from scratch"""
+        self._profiles.clear()
+        for role, (strats, _) in self.role_conf.items():
+            for strat in strats:
+                for prof in self._inst.with_strategy(role, strat):
+                    self.check_profile(prof)
+
+    @property
+    def data_revision(self):
+        """Revision of the game and the profiles it could contain"""
+        return self.revision, self._inst.revision
+
     @property
     def roles(self):
         """Roles as symgrps"""
@@ -955,55 +1870,49 @@ class _Game(object): # pylint: disable=too-many-instance-attributes
         assert role not in self.role_conf, "can't add an existing role"
         assert role in self.sim.role_conf
         self.role_conf[role] = ([], count)
-        self.updated_at = _get_time_str()
+        self.touch()
+        self._reindex()
 
     def remove_role(self, role):
         """Removes a role from the game"""
         if self.role_conf.pop(role, None) is not None:
-            self.updated_at = _get_time_str()
+            self.touch()
+            self._reindex()
 
     def add_strategy(self, role, strat):
         """Adds a strategy to the game"""
         strats, _ = self.role_conf[role]
         assert strat in self.sim.role_conf[role]
         strats.insert(bisect.bisect_left(strats, strat), strat)
-        self.updated_at = _get_time_str()
+        self.touch()
+        for prof in self._inst.with_strategy(role, strat):
+            self.check_profile(prof)
 
     def remove_strategy(self, role, strat):
         """Removes a strategy from the game"""
         try:
             self.role_conf[role][0].remove(strat)
-            self.updated_at = _get_time_str()
+            self.touch()
         except ValueError:
-            pass  # don't care
+            return  # don't care
+        for prof in self._inst.with_strategy(role, strat):
+            self._profiles.pop(prof.id, None)
 
     def destroy(self):
         """Destroy the game"""
         self.server.games_by_name.pop(self.name)
         self.server.games[self.id] = None
+        self._inst.games.discard(self)
         self._destroyed = True
 
     def get_data(self, func, keys):
         """Get generic data from the game"""
-        strats = {r: set(s) for r, (s, _)
-                  in self.role_conf.items()}
-        counts = {r: c for r, (_, c) in self.role_conf.items()}
         profs = []
-        for prof in self._assignments.values():
-            # Assignments maps to all assignments in a sim_instance_id, so we
-            # must filter by profiles that actually match
-            if not prof.obs:
-                continue  # no data
-            counts_left = counts.copy()
-            for _, role, strat, count in prof.symgrps:
-                if strat not in strats.get(role, ()):
-                    continue  # invalid profile
-                counts_left[role] -= count
-            if all(c == 0 for c in counts_left.values()):
-                jprof = func(prof)
-                for k in set(jprof.keys()).difference(keys):
-                    jprof.pop(k)
-                profs.append(jprof)
+        for pid in sorted(self._profiles):
+            jprof = func(self._profiles[pid])
+            for k in set(jprof.keys()).difference(keys):
+                jprof.pop(k)
+            profs.append(jprof)
 
         return _dict(
             self,
@@ -1044,9 +1953,110 @@ class _Game(object): # pylint: disable=too-many-instance-attributes
             ['id', 'observations', 'symmetry_groups'])
 
 
-def server(domain='egtaonline.eecs.umich.edu', **kwargs):
-    """Create a mock server"""
-    return _Server(domain, **kwargs)
+def server( # pylint: disable=too-many-arguments
+        domain='egtaonline.eecs.umich.edu', virtual_time=False,
+        auto_advance=True, seed=None, slots=None, node_memory=None,
+        queue_policy='fifo', scoped=False, cache_size=1 << 24, **kwargs):
+    """Create a mock server
+
+    Parameters
+    ----------
+    domain : str, optional
+        The domain to mock.
+    virtual_time : bool, optional
+        If true, simulations complete according to a virtual clock instead of
+        the wall clock, so long simulation delays don't take any real time.
+    auto_advance : bool, optional
+        If using virtual time, whether the clock should automatically jump to
+        the next simulation completion. If false, time only passes with calls
+        to `advance`.
+    seed : int, optional
+        Seed for the random number generator that payoff models use, making
+        payoffs reproducible.
+    slots : int, optional
+        The number of nodes in the cluster. Each simulation needs its
+        scheduler's number of nodes while running, and simulations that
+        don't fit wait in the queued state. By default the cluster is
+        unlimited and simulations start immediately.
+    node_memory : int, optional
+        The memory of each node in MB. Simulations from schedulers whose
+        process memory exceeds this fail immediately. By default nodes have
+        unlimited memory.
+    queue_policy : 'fifo' or 'backfill', optional
+        How queued simulations start. With 'fifo' they start strictly in the
+        order they were scheduled, with 'backfill' a later simulation can
+        start first if it fits on the free nodes.
+    scoped : bool, optional
+        If false, the server patches requests globally, so every api in the
+        process talks to it. If true, only sessions from `server.session`,
+        e.g. apis from `server.api`, talk to it, so several servers can run
+        independently at the same time.
+    cache_size : int, optional
+        The maximum number of characters of response text to cache. Responses
+        are cached until the data they show changes, and the least recently
+        used are evicted past this size. 0 disables caching.
+    """
+    return _Server(domain, virtual_time, auto_advance, seed, slots,
+                   node_memory, queue_policy, scoped, cache_size, **kwargs)
+
+
+def uniform_payoffs(rng, symgrps, num):
+    """Payoff model where every payoff is uniform on [0, 1)"""
+    return [rng.random() for _ in range(num * sum(c for _, _, c in symgrps))]
+
+
+def strategy_payoffs(means, noise=1.0):
+    """Payoff model with a mean payoff for each strategy and gaussian noise
+
+    Parameters
+    ----------
+    means : {role: {strategy: float}}
+        The mean payoff for playing each strategy. Missing strategies have
+        mean zero.
+    noise : float, optional
+        The standard deviation of the noise added to every payoff.
+    """
+    def model(rng, symgrps, num):
+        """Strategy means with noise"""
+        pmeans = list(itertools.chain.from_iterable(
+            itertools.repeat(means.get(role, {}).get(strat, 0.0), count)
+            for role, strat, count in symgrps))
+        return [mean + rng.gauss(0, noise) for _ in range(num)
+                for mean in pmeans]
+    return model
+
+
+def congestion_payoffs(values=None, cost=1.0, noise=0.0):
+    """Payoff model of a congestion game
+
+    Every player gets the value of their strategy minus `cost` times the number
+    of players using the same strategy, across all roles.
+
+    Parameters
+    ----------
+    values : {strategy: float}, optional
+        The value of each strategy, defaults to zero.
+    cost : float, optional
+        The congestion cost per player.
+    noise : float, optional
+        The standard deviation of gaussian noise added to every payoff.
+    """
+    values = values or {}
+
+    def model(rng, symgrps, num):
+        """Congestion payoffs"""
+        counts = collections.Counter()
+        for _, strat, count in symgrps:
+            counts[strat] += count
+        pmeans = list(itertools.chain.from_iterable(
+            itertools.repeat(
+                values.get(strat, 0.0) - cost * counts[strat], count)
+            for _, strat, count in symgrps))
+        if not noise:
+            return pmeans * num
+        return [mean + rng.gauss(0, noise) for _ in range(num)
+                for mean in pmeans]
+    return model
 
 
 def symgrps_to_assignment(symmetry_groups):
@@ -1068,14 +2078,16 @@ def _get_time_str():
     return time.strftime('%Y-%m-%dT%H:%M:%S.000Z')
 
 
-def _mean_id(iterator):
-    """Get the mean for each id"""
-    means = {}
-    for sid, pay in iterator:
-        dat = means.setdefault(sid, [0, 0.0, 0.0])
-        old_mean = dat[1]
-        dat[0] += 1
-        dat[1] += (pay - dat[1]) / dat[0]
-        dat[2] += (pay - old_mean) * (pay - dat[1])
-    return ((sid, m, math.sqrt(s / (c - 1)) if c > 1 else None)
-            for sid, (c, m, s) in means.items())
+def _update_stats(stats, pay):
+    """Update running [count, mean, m2] statistics with a new payoff"""
+    old_mean = stats[1]
+    stats[0] += 1
+    stats[1] += (pay - stats[1]) / stats[0]
+    stats[2] += (pay - old_mean) * (pay - stats[1])
+
+
+def _stats_moments(stats):
+    """Get the mean and standard deviation from running statistics"""
+    count, mean, m2 = stats # pylint: disable=invalid-name
+    return (mean if count else None,
+            math.sqrt(m2 / (count - 1)) if count > 1 else None)
@@ -0,0 +1,141 @@
+"""Pytest plugin with pre-populated mock egta online servers
+
+Worlds are built once per session and saved as snapshots, every test then
+gets its own server loaded from the snapshot, so tests can modify them freely.
+The plugin is registered as a `pytest11` entry point, so it's enabled
+whenever the package is installed.
+"""
+import collections
+import io
+import itertools
+
+import pytest
+
+from egtaonline import mockserver
+
+
+World = collections.namedtuple(
+    'World', ['server', 'sim_id', 'sched_id', 'game_id', 'profile_ids'])
+World.__doc__ = """A populated mock server that hasn't been entered yet
+
+Attributes
+----------
+server : mockserver server
+    The server, which is scoped by default, so apis should be created with
+    `server.api()`.
+sim_id : int
+    The id of the simulator.
+sched_id : int
+    The id of the scheduler that has every profile.
+game_id : int
+    The id of a game with every role and strategy.
+profile_ids : [int]
+    The ids of every profile.
+"""
+
+
+def world_assignments(roles, strategies, players):
+    """Every assignment of a world in order
+
+    Roles are named `r0`, `r1`, ..., and each has `players` players and
+    strategies named `s0`, `s1`, ...."""
+    role_assigns = []
+    for role in range(roles):
+        strats = ['s{:d}'.format(s) for s in range(strategies)]
+        role_assigns.append([
+            'r{:d}: {}'.format(role, ', '.join(
+                '{:d} {}'.format(count, strat) for strat, count
+                in sorted(collections.Counter(comb).items())))
+            for comb in itertools.combinations_with_replacement(
+                strats, players)])
+    return ['; '.join(assign) for assign in itertools.product(*role_assigns)]
+
+
+def build_world( # pylint: disable=too-many-arguments
+        roles=2, strategies=3, players=2, profiles=None, observations=1,
+        seed=0):
+    """Build a world and save it as a snapshot
+
+    Parameters
+    ----------
+    roles : int, optional
+        The number of roles.
+    strategies : int, optional
+        The number of strategies per role.
+    players : int, optional
+        The number of players per role.
+    profiles : int, optional
+        The number of profiles in the scheduler, defaults to all of them.
+    observations : int, optional
+        The number of completed observations of every profile.
+    seed : int, optional
+        The seed for the server's payoffs.
+
+    Returns
+    -------
+    snapshot : bytes
+        The serialized server.
+    ids : (sim_id, sched_id, game_id, profile_ids)
+        The ids of the objects in the snapshot.
+    """
+    server = mockserver.server(scoped=True, seed=seed)
+    role_conf = {'r{:d}'.format(r): ['s{:d}'.format(s) for s
+                                     in range(strategies)]
+                 for r in range(roles)}
+    sim_id = server.create_simulator('sim', '1', role_conf=role_conf)
+    sched_id = server.create_scheduler(
+        sim_id, 'sched', {role: players for role in role_conf})
+    assigns = world_assignments(roles, strategies, players)
+    prof_ids = server.add_profiles(
+        sched_id, assigns[:profiles], observations)
+    game_id = server.create_game(
+        sim_id, 'game', [(role, players, strats) for role, strats
+                         in sorted(role_conf.items())])
+    fil = io.BytesIO()
+    server.dump(fil)
+    return fil.getvalue(), (sim_id, sched_id, game_id, prof_ids)
+
+
+class WorldCache(object):
+    """A cache of world snapshots"""
+    def __init__(self):
+        self._snapshots = {}
+
+    def get(self, server_kwargs=None, **params):
+        """Get a fresh copy of a world
+
+        Parameters are the same as `build_world`, `server_kwargs` are passed
+        to `mockserver.server` when creating the copy. Copies are scoped
+        unless `scoped` is false in `server_kwargs`."""
+        key = tuple(sorted(params.items()))
+        if key not in self._snapshots:
+            self._snapshots[key] = build_world(**params)
+        snapshot, (sim_id, sched_id, game_id, prof_ids) = self._snapshots[key]
+        kwargs = {'scoped': True}
+        kwargs.update(server_kwargs or {})
+        server = mockserver.server(**kwargs)
+        server.load(io.BytesIO(snapshot))
+        return World(server, sim_id, sched_id, game_id, list(prof_ids))
+
+
+@pytest.fixture(scope='session')
+def mock_world_cache():
+    """The session cache of world snapshots"""
+    return WorldCache()
+
+
+@pytest.fixture
+def mock_world_factory(mock_world_cache):
+    """A factory for fresh copies of worlds
+
+    Call it with the parameters of `build_world`."""
+    return mock_world_cache.get
+
+
+@pytest.fixture
+def mock_world(request, mock_world_cache):
+    """A fresh copy of a world
+
+    Parametrize it indirectly with a dict of the parameters of `build_world`
+    to get a different world."""
+    return mock_world_cache.get(**getattr(request, 'param', {}))
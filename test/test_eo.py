@@ -366,6 +366,35 @@ async def test_sched_running():
             assert not out.getvalue()
 
 
+@pytest.mark.asyncio
+async def test_sched_running_cache(tmpdir):
+    """Test that running schedulers can use cached requirements"""
+    database = str(tmpdir.join('cache.db'))
+    async with mockserver.server() as server:
+        sim_id = server.create_simulator('sim', '1', role_conf={'r': ['s']})
+        for i in range(5):
+            sched_id = server.create_scheduler(
+                sim_id, 'sched{:d}'.format(i), {'r': 2})
+            server.add_profiles(sched_id, ['r: 2 s'], i)
+        server.create_scheduler(sim_id, 'inactive', {'r': 2}, active=False)
+
+        for count in [5, 0]:
+            server.reset_requests()
+            with stdout() as out, stderr() as err:
+                assert await run(
+                    '-a', '', 'sched', '--running', '-c', '2', '--cache',
+                    database), err.getvalue()
+            assert server.request_count(route='scheduler_get') == count
+            assert not out.getvalue()
+
+        server.reset_requests()
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', 'sched', '--running', '--cache', database, '--ttl',
+                '0'), err.getvalue()
+        assert server.request_count(route='scheduler_get') == 5
+
+
 @pytest.mark.asyncio
 async def test_sims():
     """Test getting simulations"""
@@ -382,23 +411,17 @@ async def test_sims():
                 sim_id, 'sched', True, 1, 2, 1, 1)
             await sched.add_role('r', 2)
 
-            # This fails because we don't implement search, so this is as if no
-            # job exists
             assert not await run('-a', '', 'sims', '-j', '0')
 
             await sched.add_profile('r: 1 s0, 1 s1', 1)
 
-            # This works because there's only one simulation so far and we
-            # don't implement search
+            assert not await run('-a', '', 'sims', '-j', '0')
             with stdout() as out, stderr() as err:
-                assert await run('-a', '', 'sims', '-j', '0'), err.getvalue()
+                assert await run('-a', '', 'sims', '-j', '1'), err.getvalue()
+            assert json.loads(out.getvalue())['job'] == 1
 
             await sched.add_profile('r: 2 s0', 2)
 
-            # This fails because we don't implement search and now there are
-            # several simulations
-            assert not await run('-a', '', 'sims', '-j', '0')
-
         with stdout() as out, stderr() as err:
             assert await run('-a', '', 'sims'), err.getvalue()
         sims = [json.loads(line) for line in out.getvalue()[:-1].split('\n')]
@@ -407,6 +430,158 @@ async def test_sims():
             assert await run(
                 '-a', '', 'sims', str(sims[0]['folder'])), err.getvalue()
 
+        folders = [str(s['folder']) for s in sims]
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', 'sims', '-c', '2', *folders, folders[0]), \
+                err.getvalue()
+        details = [json.loads(line) for line
+                   in out.getvalue()[:-1].split('\n')]
+        assert sorted(d['folder_number'] for d in details) == sorted(
+            s['folder'] for s in sims)
+
+        with stdout() as out, stderr() as err:
+            assert await run('-a', '', 'sims', '-j', '1', '2'), err.getvalue()
+        details = [json.loads(line) for line
+                   in out.getvalue()[:-1].split('\n')]
+        assert [d['job'] for d in details] == [1, 2]
+
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', 'sims', '--profile', '2 s0'), err.getvalue()
+        sims = [json.loads(line) for line in out.getvalue()[:-1].split('\n')]
+        assert len(sims) == 2
+        assert all(s['profile'] == 'r: 2 s0' for s in sims)
+
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', 'sims', '--simulator', 'sim-', '--state',
+                'complete'), err.getvalue()
+        sims = [json.loads(line) for line in out.getvalue()[:-1].split('\n')]
+        assert len(sims) == 3
+
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', 'sims', '--state', 'failed', '--prefetch', '0'), \
+                err.getvalue()
+        assert not out.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_formats(mock_world_factory):
+    """Test output formats"""
+    async with mockserver.server():
+        with stdout() as out, stderr() as err:
+            assert await run('-a', '', '--format', 'json', 'sims'), \
+                err.getvalue()
+        assert json.loads(out.getvalue()) == []
+
+    world = mock_world_factory(
+        {'scoped': False}, roles=1, strategies=1, observations=3)
+    sched_id = world.sched_id
+    async with world.server:
+        with stdout() as out, stderr() as err:
+            assert await run('-a', '', 'sims'), err.getvalue()
+        sims = [json.loads(line) for line in out.getvalue()[:-1].split('\n')]
+        assert len(sims) == 3
+        assert out.getvalue() == ''.join(
+            json.dumps(sim) + '\n' for sim in sims)
+
+        with stdout() as out, stderr() as err:
+            assert await run('-a', '', '--format', 'json', 'sims'), \
+                err.getvalue()
+        assert json.loads(out.getvalue()) == sims
+
+        for fmt, delim in [('csv', ','), ('tsv', '\t')]:
+            with stdout() as out, stderr() as err:
+                assert await run('-a', '', '--format', fmt, 'sims'), \
+                    err.getvalue()
+            header, *rows = out.getvalue()[:-1].split('\n')
+            assert header.split(delim) == list(sims[0])
+            assert [row.split(delim) for row in rows] == [
+                [str(s[k]) for k in sims[0]] for s in sims]
+
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', '--format', 'json', 'sched', str(sched_id)), \
+                err.getvalue()
+        assert json.loads(out.getvalue())['id'] == sched_id
+
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', '--format', 'csv', 'sched', str(sched_id), '-r'), \
+                err.getvalue()
+        header, row = out.getvalue()[:-1].split('\n')
+        assert 'scheduling_requirements' in header.split(',')
+        assert '""current_count"": 3' in row
+
+
+@pytest.mark.asyncio
+async def test_mirror(tmpdir, mock_world_factory):
+    """Test syncing and querying a mirror"""
+    database = str(tmpdir.join('sims.db'))
+    world = mock_world_factory(
+        {'scoped': False}, roles=1, strategies=1, observations=3)
+    async with world.server:
+        with stdout() as out, stderr() as err:
+            assert await run('-a', '', 'mirror', database), err.getvalue()
+        assert json.loads(out.getvalue()) == {
+            'added': 3, 'updated': 0, 'refreshed': 0}
+
+    with stdout() as out, stderr() as err:
+        assert await run(
+            'mirror', database, '--query', '--state', 'complete',
+            '--simulator', 'sim-1', '--since', '60'), err.getvalue()
+    sims = [json.loads(line) for line in out.getvalue()[:-1].split('\n')]
+    assert len(sims) == 3
+    assert all(s['profile'] == 'r0: 2 s0' for s in sims)
+
+    with stdout() as out, stderr() as err:
+        assert await run(
+            '--format', 'json', 'mirror', database, '-q', '--state',
+            'failed'), err.getvalue()
+    assert json.loads(out.getvalue()) == []
+
+
+@pytest.mark.asyncio
+async def test_job_index(tmpdir, mock_world_factory):
+    """Test that job lookups use the job index"""
+    database = str(tmpdir.join('jobs.db'))
+    world = mock_world_factory(
+        {'scoped': False}, roles=1, strategies=1, observations=3)
+    async with world.server as server:
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', '--job-index', database, 'sims', '--prefetch',
+                '0'), err.getvalue()
+        sims = {s['job']: s for s in map(
+            json.loads, out.getvalue()[:-1].split('\n'))}
+
+        server.reset_requests()
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', '--job-index', database, 'sims', '-j', '2'), \
+                err.getvalue()
+        assert json.loads(out.getvalue()) == sims[2]
+        assert server.request_count(route='simulation_all') == 0
+        assert server.request_count(route='simulation_get') == 1
+
+
+@pytest.mark.asyncio
+async def test_sched_progress(mock_world_factory):
+    """Test streaming scheduler progress"""
+    world = mock_world_factory(
+        {'scoped': False}, roles=1, strategies=1, observations=3)
+    async with world.server:
+        with stdout() as out, stderr() as err:
+            assert await run(
+                '-a', '', 'sched', str(world.sched_id), '--progress', '-i',
+                '0.01'), err.getvalue()
+        prog = json.loads(out.getvalue())
+        assert prog['id'] == world.sched_id
+        assert prog['completed'] == prog['required'] == 3
+        assert prog['complete']
+
 
 @pytest.mark.asyncio
 async def test_authfile():
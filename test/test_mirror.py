@@ -0,0 +1,191 @@
+"""Tests for the simulation mirror"""
+import time
+
+import pytest
+
+from egtaonline import api
+from egtaonline import mirror
+from egtaonline import mockserver
+
+
+async def agather(aiter):
+    """Gather an async iterator into a list"""
+    lst = []
+    async for elem in aiter:
+        lst.append(elem)
+    return lst
+
+
+@pytest.mark.asyncio
+async def test_sync():
+    """Test that syncing stops at mirrored rows and refreshes unfinished"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False, slots=1) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        sched_id = server.create_scheduler(sim_id, 'sched', {'a': 2})
+        server.add_profiles(sched_id, ['a: 2 1'], 30)
+        sched = await egta.get_scheduler(sched_id)
+        await sched.add_profile('a: 1 1, 1 2', 2)
+        other_id = server.create_scheduler(sim_id, 'other', {'a': 2})
+        server.add_profiles(other_id, ['a: 2 2'], 5)
+
+        with mirror.Mirror(':memory:') as mirr:
+            stats = await mirr.sync(egta)
+            assert stats == {'added': 37, 'updated': 0, 'refreshed': 0}
+            assert len(mirr) == 37
+            assert [s['state'] for s in mirr.query(limit=7)] == \
+                ['complete'] * 5 + ['queued', 'running']
+
+            server.reset_requests()
+            stats = await mirr.sync(egta)
+            assert stats == {'added': 0, 'updated': 0, 'refreshed': 0}
+            assert server.request_count(route='simulation_get') == 2
+
+            server.advance(25)
+            server.add_profiles(other_id, ['a: 2 1'], 31)
+            stats = await mirr.sync(egta)
+            assert stats == {'added': 1, 'updated': 0, 'refreshed': 2}
+            assert len(mirr.query(state='complete')) == 38
+            sims = mirr.query(state='complete', limit=8)
+            assert [s['job'] for s in sims[6:]] == [37, 31]
+            assert all(s['updated'] >= s['first_seen'] for s in sims)
+
+            stats = await mirr.sync(egta)
+            assert stats == {'added': 0, 'updated': 0, 'refreshed': 0}
+
+
+@pytest.mark.asyncio
+async def test_query():
+    """Test querying a mirror"""
+    async with mockserver.server() as server, api.api('') as egta:
+        for name in ['a', 'b']:
+            sim_id = server.create_simulator(
+                name, '1', role_conf={'r': ['x', 'y']})
+            sched_id = server.create_scheduler(sim_id, name, {'r': 2})
+            server.add_profiles(sched_id, ['r: 2 x', 'r: 1 x, 1 y'], 2)
+
+        with mirror.Mirror(':memory:') as mirr:
+            start = time.time()
+            await mirr.sync(egta)
+            sims = mirr.query()
+            assert len(sims) == 8
+            folders = [s['folder'] for s in sims]
+            assert folders == sorted(folders, reverse=True)
+            assert set(sims[0]) == {'folder', 'job', 'state', 'profile',
+                                    'simulator', 'first_seen', 'updated'}
+            assert len(mirr.query(simulator='a-1')) == 4
+            assert not mirr.query(simulator='a')
+            assert len(mirr.query(profile='1 y')) == 4
+            assert len(mirr.query(simulator='b-1', profile='2 x')) == 2
+            assert len(mirr.query(since=start)) == 8
+            assert not mirr.query(since=time.time() + 1)
+            assert not mirr.query(state='failed')
+            assert mirr.query(limit=3) == sims[:3]
+
+
+@pytest.mark.asyncio
+async def test_persistent(tmpdir, mock_world_factory):
+    """Test that mirrors are saved"""
+    path = str(tmpdir.join('sims.db'))
+    world = mock_world_factory(roles=1, strategies=1, observations=3)
+    async with world.server as server, server.api() as egta:
+        with mirror.Mirror(path) as mirr:
+            await mirr.sync(egta)
+        with mirror.Mirror(path) as mirr:
+            assert len(mirr) == 3
+            stats = await mirr.sync(egta)
+            assert stats == {'added': 0, 'updated': 0, 'refreshed': 0}
+
+
+@pytest.mark.asyncio
+async def test_job_index(tmpdir, mock_world_factory):
+    """Test that job indices are saved"""
+    path = str(tmpdir.join('sims.db'))
+    world = mock_world_factory(roles=1, strategies=1, observations=3)
+    async with world.server as server:
+        with mirror.JobIndex(path) as index:
+            assert not index
+            async with server.api(job_index=index) as egta:
+                sims = await agather(egta.get_simulations())
+            assert dict(index) == {s['job']: s['folder'] for s in sims}
+
+        with mirror.JobIndex(path) as index, mirror.Mirror(path) as mirr:
+            assert len(index) == 3
+            assert index[sims[0]['job']] == sims[0]['folder']
+            del index[sims[0]['job']]
+            with pytest.raises(KeyError):
+                del index[sims[0]['job']]
+            with pytest.raises(KeyError):
+                index[sims[0]['job']] # pylint: disable=pointless-statement
+            index[10] = 20
+            assert not mirr
+        with mirror.JobIndex(path) as index:
+            assert dict(index) == dict(
+                [(10, 20)] + [(s['job'], s['folder']) for s in sims[1:]])
+
+
+def test_requirements_cache(tmpdir):
+    """Test that requirements are cached until they expire"""
+    path = str(tmpdir.join('cache.db'))
+    reqs = {'id': 1, 'active': True, 'scheduling_requirements': [
+        {'id': 2, 'current_count': 1, 'requirement': 2}]}
+    with mirror.RequirementsCache(path, 60) as cache:
+        assert not cache
+        cache[1] = reqs
+        assert cache[1] == reqs
+    with mirror.RequirementsCache(path, 60) as cache, \
+            mirror.RequirementsCache(path, 0) as expired:
+        assert dict(cache) == {1: reqs}
+        assert 1 not in expired
+        assert not expired
+        with pytest.raises(KeyError):
+            del expired[1]
+        expired.expire()
+        expired.commit()
+        assert not cache
+        cache[3] = reqs
+        del cache[3]
+        with pytest.raises(KeyError):
+            cache[3] # pylint: disable=pointless-statement
+
+
+@pytest.mark.asyncio
+async def test_requirements_cache_api(tmpdir, mock_world_factory):
+    """Test that cached requirements are returned like fetched ones"""
+    path = str(tmpdir.join('cache.db'))
+    lookups = []
+
+    class CountedCache(mirror.RequirementsCache):
+        """Count cache lookups"""
+        def __getitem__(self, sched_id):
+            lookups.append(sched_id)
+            return super().__getitem__(sched_id)
+
+    world = mock_world_factory(roles=1, strategies=2)
+    async with world.server as server, server.api() as egta:
+        sched_ids = [world.sched_id] + [server.create_scheduler(
+            world.sim_id, 'sched{:d}'.format(i), {'r0': 2}) for i in range(2)]
+        for sched_id in sched_ids[1:]:
+            server.add_profiles(sched_id, ['r0: 2 s0'], 1)
+        scheds = [await egta.get_scheduler(i) for i in sched_ids]
+
+        with CountedCache(path, 60) as cache:
+            fetched = await agather(egta.get_requirements_all(
+                scheds, cache=cache))
+            assert sorted(lookups) == sched_ids
+            lookups.clear()
+            server.reset_requests()
+            cached = await agather(egta.get_requirements_all(
+                scheds, cache=cache))
+            assert sorted(lookups) == sched_ids
+            assert not server.request_count()
+
+        assert sorted(cached, key=lambda r: r['id']) == sorted(
+            fetched, key=lambda r: r['id'])
+        for reqs in cached:
+            assert type(reqs) is type(fetched[0]) # pylint: disable=unidiomatic-typecheck
+            for prof in reqs['scheduling_requirements']:
+                summ = await prof.get_summary()
+                assert summ['observations_count'] == 1
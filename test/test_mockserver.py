@@ -1,11 +1,17 @@
 """Tests for mock server and api"""
 import asyncio
+import contextlib
+import io
 import itertools
 import json
+import math
+import threading
+from concurrent import futures
 
 import jsonschema
 import pytest
 import requests
+from lxml import etree
 
 from egtaonline import api
 from egtaonline import mockserver
@@ -468,6 +474,369 @@ async def test_delayed_profiles():
         await sched.add_profile('1: 8 a; 2: 2 b', 1)
 
 
+@pytest.mark.asyncio
+async def test_profile_summary_stats():
+    """Test that profile summaries agree with the full data"""
+    async with mockserver.server() as server, api.api('') as egta:
+        sim = await create_simulator(server, egta, 'sim', '1')
+        sched = await sim.create_generic_scheduler('sched', True, 0, 4, 0, 0)
+        await sched.add_roles({'a': 2, 'b': 2})
+        prof = await sched.add_profile('a: 1 1, 1 2; b: 2 5', 5)
+        await sched_complete(sched)
+
+        full = await prof.get_full_data()
+        pays = {}
+        for obs in full['observations']:
+            for player in obs['players']:
+                pays.setdefault(player['sid'], []).append(player['p'])
+
+        summ = await prof.get_summary()
+        assert summ['observations_count'] == 5
+        for symgrp in summ['symmetry_groups']:
+            spays = pays[symgrp['id']]
+            mean = sum(spays) / len(spays)
+            var = sum((p - mean) ** 2 for p in spays) / (len(spays) - 1)
+            assert symgrp['payoff'] == pytest.approx(mean)
+            assert symgrp['payoff_sd'] == pytest.approx(var ** 0.5)
+
+        obs = await prof.get_observations()
+        for oobs, fobs in zip(obs['observations'], full['observations']):
+            for symgrp in oobs['symmetry_groups']:
+                spays = [p['p'] for p in fobs['players']
+                         if p['sid'] == symgrp['id']]
+                assert symgrp['payoff'] == pytest.approx(
+                    sum(spays) / len(spays))
+
+
+@pytest.mark.asyncio
+async def test_virtual_time():
+    """Test that virtual time completes long simulations instantly"""
+    async with mockserver.server(virtual_time=True) as server, \
+            api.api('') as egta:
+        sim = await egta.get_simulator(server.create_simulator(
+            'sim', '1', delay_dist=lambda: 3600))
+        await sim.add_strategies({'r': ['a', 'b']})
+        sched = await sim.create_generic_scheduler('sched', True, 0, 2, 0, 0)
+        await sched.add_role('r', 2)
+        await sched.add_profile('r: 1 a, 1 b', 3)
+        await sched.add_profile('r: 2 a', 2)
+        await sched_complete(sched)
+        reqs = (await sched.get_requirements())['scheduling_requirements']
+        assert all(r['current_count'] == r['requirement'] for r in reqs)
+
+
+@pytest.mark.asyncio
+async def test_advance_time():
+    """Test manually advancing virtual time"""
+    delays = iter([10, 20, 10])
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False) as server, \
+            api.api('') as egta:
+        sim = await egta.get_simulator(server.create_simulator(
+            'sim', '1', delay_dist=lambda: next(delays)))
+        await sim.add_strategies({'r': ['a']})
+        sched = await sim.create_generic_scheduler('sched', True, 0, 1, 0, 0)
+        await sched.add_role('r', 1)
+        prof = await sched.add_profile('r: 1 a', 3)
+
+        server.advance(5)
+        assert (await prof.get_structure())['observations_count'] == 0
+        server.advance(5)
+        assert (await prof.get_structure())['observations_count'] == 2
+        states = [s['state'] for s in await agather(egta.get_simulations())]
+        assert states == ['complete', 'running', 'complete']
+        server.advance(10)
+        assert (await prof.get_structure())['observations_count'] == 3
+
+    async with mockserver.server() as server:
+        with pytest.raises(AssertionError):
+            server.advance(1)
+
+
+async def cluster_states(server, egta, sched, profile, count):
+    """Add a profile and get the state of every simulation"""
+    await sched.add_profile(profile, count)
+    return [s['state'] for s in await agather(
+        egta.get_simulations(column='folder', asc=True))]
+
+
+@pytest.mark.asyncio
+async def test_cluster_slots():
+    """Test that simulations queue for free nodes"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False, slots=3) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        sched = await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'sched', {'a': 2}, nodes=2))
+        states = await cluster_states(server, egta, sched, 'a: 2 1', 3)
+        assert states == ['running', 'queued', 'queued']
+        sims = await agather(egta.get_simulations(column='folder', asc=True))
+        assert [s['job'] for s in sims[:1]] == [1]
+        assert all(math.isnan(s['job']) for s in sims[1:])
+        assert (await egta.get_simulation(sims[1]['folder']))['job'] == \
+            'Not specified'
+
+        server.advance(25)
+        sims = await agather(egta.get_simulations(column='folder', asc=True))
+        assert [s['state'] for s in sims] == ['complete', 'complete',
+                                              'running']
+        assert [s['job'] for s in sims] == [1, 2, 3]
+
+        server.cancel_simulation(sims[2]['folder'])
+        info = await egta.get_simulation(sims[2]['folder'])
+        assert info['state'] == 'canceled'
+        with pytest.raises(requests.exceptions.HTTPError):
+            await egta.get_simulation(sims[2]['folder'] + 1)
+        reqs = (await sched.get_requirements())['scheduling_requirements']
+        assert reqs[0]['current_count'] == 2
+
+
+@pytest.mark.asyncio
+async def test_cluster_queue_policy():
+    """Test fifo and backfill queue policies"""
+    for policy, expected in [
+            ('fifo', ['running', 'queued', 'queued']),
+            ('backfill', ['running', 'queued', 'running'])]:
+        async with mockserver.server(
+                virtual_time=True, auto_advance=False, slots=3,
+                queue_policy=policy) as server, api.api('') as egta:
+            sim_id = server.create_simulator(
+                'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1']})
+            big = await egta.get_scheduler(server.create_scheduler(
+                sim_id, 'big', {'a': 2}, nodes=2))
+            small = await egta.get_scheduler(server.create_scheduler(
+                sim_id, 'small', {'a': 2}, nodes=1, time_per_observation=1,
+                conf={'small': 1}))
+            await cluster_states(server, egta, big, 'a: 2 1', 2)
+            states = await cluster_states(server, egta, small, 'a: 2 1', 1)
+            assert states == expected
+
+
+@pytest.mark.asyncio
+async def test_cluster_failures():
+    """Test simulations that fail"""
+    async with mockserver.server(
+            virtual_time=True, slots=2, node_memory=1024, seed=0) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', failure_rate=0.5, role_conf={'a': ['1']})
+        sched = await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'sched', {'a': 2}, process_memory=512))
+        await sched.add_profile('a: 2 1', 10)
+        await sched_complete(sched)
+        sims = await agather(egta.get_simulations())
+        assert sum(s['state'] == 'complete' for s in sims) == 10
+        failed = await agather(egta.get_simulations(search='state="failed"'))
+        assert failed
+        info = await egta.get_simulation(failed[0]['folder'])
+        assert info['error_message'] == \
+            'Simulation exited with a non-zero status'
+
+        for sid, mem, nodes in [(2, 2048, 1), (3, 512, 3)]:
+            sched = await egta.get_scheduler(server.create_scheduler(
+                sim_id, 'sched{:d}'.format(sid), {'a': 2}, nodes=nodes,
+                process_memory=mem, conf={'sid': sid}))
+            await sched.add_profile('a: 2 1', 1)
+            info = await egta.get_simulation((await agather(
+                egta.get_simulations(column='folder')))[0]['folder'])
+            assert info['state'] == 'failed'
+            assert info['error_message'].startswith(
+                'Process memory' if sid == 2 else 'Requires 3 nodes')
+
+
+@pytest.mark.asyncio
+async def test_snapshot():
+    """Test dumping and loading server snapshots"""
+    snapshot = io.BytesIO()
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False) as server, \
+            api.api('') as egta:
+        sim = await create_simulator(server, egta, 'sim', '1')
+        sched = await sim.create_generic_scheduler('sched', True, 0, 4, 0, 0)
+        await sched.add_roles({'a': 2, 'b': 2})
+        await sched.add_profile('a: 2 1; b: 2 5', 2)
+        server.advance(0)
+        await sched.add_profile('a: 1 1, 1 2; b: 2 5', 1)
+        game = await sched.create_game()
+        await game.add_symgroups([('a', 2, ['1', '2']), ('b', 2, ['5'])])
+
+        sims = [(s['folder'], s['state']) for s
+                in await agather(egta.get_simulations())]
+        summ = await game.get_summary()
+        reqs = await sched.get_requirements()
+        server.dump(snapshot)
+
+    snapshot.seek(0)
+    server = mockserver.server(virtual_time=True, auto_advance=False)
+    server.load(snapshot, {'sim-1': lambda: 5})
+    async with server, api.api('') as egta:
+        sched = await egta.get_scheduler(sched['id'])
+        game = await egta.get_game(game['id'])
+        assert sims == [(s['folder'], s['state']) for s
+                        in await agather(egta.get_simulations())]
+        assert await game.get_summary() == summ
+        assert await sched.get_requirements() == reqs
+        server.advance(0)
+        assert len((await game.get_summary())['profiles']) == 2
+
+        await sched.add_profile('a: 2 2; b: 2 5', 1)
+        server.advance(4)
+        assert len((await game.get_summary())['profiles']) == 2
+        server.advance(1)
+        assert len((await game.get_summary())['profiles']) == 3
+
+        # Loaded state is independent and can be modified
+        sim = await egta.get_simulator(server.create_simulator('sim', '2'))
+        assert sim['id'] == 1
+        with pytest.raises(AssertionError):
+            snapshot.seek(0)
+            server.load(snapshot)
+
+
+@pytest.mark.asyncio
+async def test_bulk_seeding():
+    """Test creating server data directly"""
+    async with mockserver.server() as server, api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', role_conf={'a': ['2', '1'], 'b': ['3']})
+        sim = await egta.get_simulator(sim_id)
+        assert sim['role_configuration'] == {'a': ['1', '2'], 'b': ['3']}
+
+        sched_id = server.create_scheduler(sim_id, 'sched', {'a': 2, 'b': 1})
+        sched = await egta.get_scheduler(sched_id)
+        assert sched['size'] == 3
+        prof_ids = server.add_profiles(sched_id, [
+            'a: 2 1; b: 1 3',
+            [{'role': 'a', 'strategy': '1', 'count': 1},
+             {'role': 'a', 'strategy': '2', 'count': 1},
+             {'role': 'b', 'strategy': '3', 'count': 1}],
+        ], 3)
+        assert prof_ids == [0, 1]
+        reqs = (await sched.get_requirements())['scheduling_requirements']
+        assert all(r['current_count'] == r['requirement'] == 3 for r in reqs)
+        sims = await agather(egta.get_simulations(column='profile'))
+        assert len(sims) == 6
+        assert all(s['state'] == 'complete' for s in sims)
+        assert is_sorted((s['profile'] for s in sims), reverse=True)
+
+        game = await egta.get_game(server.create_game(
+            sim_id, 'game', [('a', 2, ['1']), ('b', 1, ['3'])]))
+        summ = await game.get_summary()
+        assert [p['id'] for p in summ['profiles']] == [0]
+        assert summ['profiles'][0]['observations_count'] == 3
+
+
+async def seeded_payoffs(seed, **kwargs):
+    """Get the full observations of a seeded profile"""
+    async with mockserver.server(seed=seed) as server, api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', role_conf={'a': ['1', '2'], 'b': ['3']}, **kwargs)
+        sched_id = server.create_scheduler(sim_id, 'sched', {'a': 2, 'b': 1})
+        prof_id, = server.add_profiles(sched_id, ['a: 1 1, 1 2; b: 1 3'], 4)
+        prof = await egta.get_profile(prof_id)
+        return await prof.get_full_data()
+
+
+def full_strategy_payoffs(full):
+    """Map role and strategy to the set of payoffs from full data"""
+    syms = {s['id']: (s['role'], s['strategy'])
+            for s in full['symmetry_groups']}
+    pays = {}
+    for obs in full['observations']:
+        for player in obs['players']:
+            pays.setdefault(syms[player['sid']], set()).add(player['p'])
+    return pays
+
+
+@pytest.mark.asyncio
+async def test_seeded_payoffs():
+    """Test that seeded servers generate the same payoffs"""
+    first = await seeded_payoffs(7)
+    assert first == await seeded_payoffs(7)
+    assert first != await seeded_payoffs(8)
+
+
+@pytest.mark.asyncio
+async def test_payoff_models():
+    """Test built in and custom payoff models"""
+    full = await seeded_payoffs(0, payoff_model=mockserver.strategy_payoffs(
+        {'a': {'1': 1, '2': 2}, 'b': {'3': 3}}, 0))
+    pays = full_strategy_payoffs(full)
+    assert pays == {('a', '1'): {1}, ('a', '2'): {2}, ('b', '3'): {3}}
+
+    full = await seeded_payoffs(0, payoff_model=mockserver.congestion_payoffs(
+        {'1': 5}, 2))
+    pays = full_strategy_payoffs(full)
+    assert pays == {('a', '1'): {3}, ('a', '2'): {-2}, ('b', '3'): {-2}}
+
+    def model(_, symgrps, num):
+        """One payoff per symmetry group, which is too few"""
+        return [0.0 for _ in range(num) for _ in symgrps[1:]]
+
+    with pytest.raises(AssertionError):
+        await seeded_payoffs(0, payoff_model=model)
+
+
+@pytest.mark.asyncio
+async def test_request_budgets():
+    """Test request accounting and budgets for common operations"""
+    async with mockserver.server() as server, api.api('') as egta:
+        sim_id = server.create_simulator('sim', '1', role_conf={'a': []})
+        sim = await egta.get_simulator(sim_id)
+        assert server.request_counts() == {
+            ('GET', 'session'): 1, ('GET', 'simulator_get'): 1}
+        assert server.bytes_served() > 0
+        server.reset_requests()
+        assert not server.request_count()
+
+        strats = ['1', '2', '3']
+        with server.request_budget(len(strats) + 2):
+            await sim.add_strategies({'a': strats})
+        assert server.request_count('POST') == len(strats)
+        assert server.request_count(route='simulator_add_strategy') == 3
+
+        symgrps = [('a', 2, strats)]
+        game = await sim.get_canon_game(symgrps)
+        with server.request_budget(1):
+            assert (await sim.get_canon_game(symgrps))['id'] == game['id']
+        with server.request_budget(0, 'POST'):
+            await game.get_summary()
+
+        with pytest.raises(AssertionError):
+            with server.request_budget(1):
+                await egta.get_simulator(sim_id)
+                await egta.get_simulator(sim_id)
+
+
+async def scoped_scenario(num):
+    """Run an independent scenario on a scoped server"""
+    async with mockserver.server(scoped=True) as server, server.api() as egta:
+        sim_id = server.create_simulator('sim', '1', role_conf={'a': ['1']})
+        sched = await egta.get_scheduler(
+            server.create_scheduler(sim_id, 'sched', {'a': 2}))
+        await sched.add_profile('a: 2 1', num)
+        await sched_complete(sched)
+        return len(await agather(egta.get_simulations()))
+
+
+@pytest.mark.asyncio
+async def test_scoped_servers():
+    """Test that scoped servers are independent"""
+    assert await asyncio.gather(*[
+        scoped_scenario(num) for num in range(1, 5)]) == [1, 2, 3, 4]
+
+    async with mockserver.server() as glob, \
+            mockserver.server(scoped=True) as scoped:
+        scoped.create_simulator('sim', '1')
+        async with api.api('') as egta, scoped.api() as segta:
+            assert not await egta.get_simulators()
+            assert len(await segta.get_simulators()) == 1
+        assert glob.request_count(route='simulator_all') == 1
+        assert scoped.request_count(route='simulator_all') == 1
+
+
 @pytest.mark.asyncio
 async def test_missing_profile():
     """Test getting missing profile"""
@@ -576,6 +945,125 @@ async def test_game():
         assert sched['size'] == game['size']
 
 
+@pytest.mark.asyncio
+async def test_game_profile_updates():
+    """Test that game profiles track strategy and role changes"""
+    async with mockserver.server() as server, \
+            api.api('', num_tries=3, retry_delay=0.5) as egta:
+        sim = await create_simulator(server, egta, 'sim', '1')
+        sched = await sim.create_generic_scheduler('sched', True, 0, 4, 0, 0)
+        await sched.add_roles({'a': 2, 'b': 2})
+        await sched.add_profile('a: 2 1; b: 2 5', 1)
+        await sched.add_profile('a: 1 1, 1 2; b: 2 5', 1)
+        await sched.add_profile('a: 2 2; b: 1 5, 1 6', 1)
+        await sched_complete(sched)
+
+        game = await sched.create_game()
+        await game.add_symgroups([('a', 2, ['1']), ('b', 2, ['5'])])
+        profs = (await game.get_summary())['profiles']
+        assert [p['id'] for p in profs] == [0]
+
+        await game.add_strategy('a', '2')
+        profs = (await game.get_summary())['profiles']
+        assert [p['id'] for p in profs] == [0, 1]
+
+        await game.add_strategy('b', '6')
+        profs = (await game.get_summary())['profiles']
+        assert [p['id'] for p in profs] == [0, 1, 2]
+
+        await game.remove_strategy('a', '1')
+        profs = (await game.get_summary())['profiles']
+        assert [p['id'] for p in profs] == [2]
+
+        await game.remove_role('b')
+        assert not (await game.get_summary())['profiles']
+        await game.add_symgroup('b', 2, ['5', '6'])
+        profs = (await game.get_summary())['profiles']
+        assert [p['id'] for p in profs] == [2]
+
+        await sched.add_profile('a: 2 2; b: 2 6', 1)
+        await sched_complete(sched)
+        profs = (await game.get_summary())['profiles']
+        assert [p['id'] for p in profs] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_cached_responses(monkeypatch):
+    """Test that responses are cached until the data changes"""
+    calls = []
+    get_summary = mockserver._Game.get_summary # pylint: disable=protected-access
+
+    def counted_summary(game):
+        """Count summary calls"""
+        calls.append(game.id)
+        return get_summary(game)
+
+    monkeypatch.setattr(
+        mockserver._Game, 'get_summary', counted_summary) # pylint: disable=protected-access
+    async with mockserver.server() as server, api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', role_conf={'a': ['1', '2']})
+        sched_id = server.create_scheduler(sim_id, 'sched', {'a': 2})
+        sched = await egta.get_scheduler(sched_id)
+        server.add_profiles(sched_id, ['a: 2 1'], 1)
+        game = await egta.get_game(server.create_game(
+            sim_id, 'game', [('a', 2, ['1'])]))
+
+        summ = await game.get_summary()
+        assert summ == await game.get_summary()
+        assert len(calls) == 1
+
+        await sched.add_profile('a: 1 1, 1 2', 1)
+        await sched_complete(sched)
+        await game.add_strategy('a', '2')
+        summ = await game.get_summary()
+        assert [p['id'] for p in summ['profiles']] == [0, 1]
+        assert summ == await game.get_summary()
+        assert len(calls) == 2
+
+        await sched.add_profile('a: 2 2', 2)
+        await sched_complete(sched)
+        summ = await game.get_summary()
+        assert [p['id'] for p in summ['profiles']] == [0, 1, 2]
+        assert summ['profiles'][2]['observations_count'] == 2
+        assert len(calls) == 3
+
+
+@pytest.mark.asyncio
+async def test_cached_responses_bounded():
+    """Test that the response cache evicts past its size"""
+    async with mockserver.server(cache_size=1000) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', role_conf={'a': ['1', '2']})
+        sched_id = server.create_scheduler(sim_id, 'sched', {'a': 2})
+        prof_id, *_ = server.add_profiles(
+            sched_id, ['a: 2 1', 'a: 1 1, 1 2', 'a: 2 2'], 1)
+        sched = await egta.get_scheduler(sched_id)
+        reqs = await sched.get_requirements()
+        for _ in range(3):
+            for prof in reqs['scheduling_requirements']:
+                for info in [await prof.get_structure(),
+                             await prof.get_summary(),
+                             await prof.get_observations(),
+                             await prof.get_full_data()]:
+                    assert info['id'] == prof['id']
+        cached = server._data._cache # pylint: disable=protected-access
+        assert cached
+        assert sum(len(text) for _, text in cached.values()) <= 1000
+
+        sched2_id = server.create_scheduler(sim_id, 'sched2', {'a': 2})
+        server.add_profiles(sched2_id, ['a: 2 1'], 2)
+        prof = await egta.get_profile(prof_id)
+        assert (await prof.get_summary())['observations_count'] == 2
+
+    async with mockserver.server(cache_size=0) as server, api.api('') as egta:
+        sim_id = server.create_simulator('sim', '1')
+        sim = await egta.get_simulator(sim_id)
+        assert (await sim.get_info())['id'] == sim_id
+        assert not server._data._cache # pylint: disable=protected-access
+
+
 @pytest.mark.asyncio
 async def test_canon_game(): # pylint: disable=too-many-locals
     """Test that canon game creates proper games"""
@@ -759,7 +1247,7 @@ async def test_get_simulations():
         validate_object(await egta.get_simulation(simul['folder']), {
             'error_message': {'type': 'string'},
             'folder_number': {'type': 'integer'},
-            'job': {'type': 'string'},
+            'job': {'type': 'integer'},
             'profile': {'type': 'string'},
             'simulator_fullname': {'type': 'string'},
             'size': {'type': 'integer'},
@@ -808,6 +1296,595 @@ async def test_get_simulations():
         assert not await agather(egta.get_simulations(page_start=2))
         await sched2.add_profile('a: 2 1; b: 1 5, 2 6', 21)
         assert len(await agather(egta.get_simulations(page_start=2))) == 1
+        await sched_complete(sched2)
+
+        sims = await agather(egta.get_simulations(
+            search='profile="2 7" simulator="sim-2"'))
+        assert len(sims) == 3
+        assert all(s['simulator'] == 'sim-2' for s in sims)
+        assert is_sorted((s['folder'] for s in sims), reverse=True)
+        sims = await agather(egta.get_simulations(
+            search='state="complete"', column='profile', asc=True))
+        assert len(sims) == 26
+        assert is_sorted(s['profile'] for s in sims)
+        assert len(await agather(egta.get_simulations(
+            search='simulator="sim-1"', page_start=2))) == 0
+        assert not await agather(egta.get_simulations(search='job="0"'))
+        sims = await agather(egta.get_simulations(search='job="1"'))
+        assert [s['job'] for s in sims] == [1]
+        assert is_sorted(  # pragma: no branch
+            f['job'] for f
+            in await agather(egta.get_simulations(asc=True, column='job')))
+        with pytest.raises(requests.exceptions.HTTPError):
+            await agather(egta.get_simulations(search='unknown="key"'))
+        with pytest.raises(requests.exceptions.HTTPError):
+            await agather(egta.get_simulations(search='unparsed'))
+
+
+@pytest.mark.asyncio
+async def test_simulations_prefetch(mock_world_factory):
+    """Test prefetching pages of simulations"""
+    world = mock_world_factory(roles=1, strategies=1, observations=60)
+    async with world.server as server:
+        async with server.api() as egta:
+            server.reset_requests()
+            expected = await agather(egta.get_simulations())
+        assert len(expected) == 60
+        assert server.request_count(route='simulation_all') == 4
+
+        # Shutting down the executor waits for requests that were sent
+        for prefetch in [1, 3, 10]:
+            server.reset_requests()
+            with futures.ThreadPoolExecutor(4) as executor:
+                async with server.api(executor=executor) as egta:
+                    sims = await agather(egta.get_simulations(
+                        prefetch=prefetch))
+            assert sims == expected
+            assert 4 <= server.request_count(route='simulation_all') <= \
+                4 + prefetch
+
+        server.reset_requests()
+        with futures.ThreadPoolExecutor(4) as executor:
+            async with server.api(executor=executor) as egta:
+                sims = egta.get_simulations(prefetch=2)
+                assert await sims.__anext__() == expected[0]
+                assert server.request_count(route='simulation_all') == 1
+                for sim in expected[1:26]:
+                    assert await sims.__anext__() == sim
+                await sims.aclose()
+                with pytest.raises(StopAsyncIteration):
+                    await sims.__anext__()
+        assert 2 <= server.request_count(route='simulation_all') <= 4
+
+
+@pytest.mark.asyncio
+async def test_simulations_cursor(mock_world_factory):
+    """Test simulations aren't duplicated when rows shift and can resume"""
+    world = mock_world_factory(roles=1, strategies=1, observations=60)
+    async with world.server as server, server.api() as egta:
+        expected = await agather(egta.get_simulations())
+
+        sims = egta.get_simulations(prefetch=0)
+        first = [await sims.__anext__() for _ in range(30)]
+        assert first == expected[:30]
+        cursor = json.loads(json.dumps(sims.cursor))
+        assert cursor['page'] == 2
+        other_id = server.create_scheduler(world.sim_id, 'other', {'r0': 2})
+        server.add_profiles(other_id, ['r0: 2 s0'], 70)
+        rest = await agather(sims)
+        assert sims.duplicates == 10
+        assert first + rest == expected
+        assert len(sims.cursor['seen']) <= 50
+
+        resumed = egta.get_simulations(cursor=cursor)
+        rest = await agather(resumed)
+        assert resumed.duplicates == 15
+        assert first + rest == expected
+
+
+@pytest.mark.asyncio
+async def test_simulations_detail(mock_world_factory):
+    """Test fetching several simulations concurrently"""
+    world = mock_world_factory(roles=1, strategies=1, observations=10)
+    async with world.server as server, server.api() as egta:
+        folders = [s['folder'] for s in await agather(egta.get_simulations())]
+        expected = {folder: await egta.get_simulation(folder)
+                    for folder in folders}
+
+        fetch = egta.get_simulation
+        active = [0, 0]
+
+        async def get_simulation(folder):
+            """Get a simulation and track the number fetching"""
+            active[0] += 1
+            active[1] = max(active)
+            try:
+                return await fetch(folder)
+            finally:
+                active[0] -= 1
+
+        egta.get_simulation = get_simulation
+        server.reset_requests()
+        sims = await agather(egta.get_simulations_detail(
+            folders + folders[::-1], 3))
+        assert sorted(sims, key=lambda s: s['folder_number']) == [
+            expected[folder] for folder in sorted(folders)]
+        assert server.request_count(route='simulation_get') == 10
+        assert active == [0, 3]
+
+        assert not await agather(egta.get_simulations_detail([]))
+        with pytest.raises(requests.exceptions.HTTPError):
+            await agather(egta.get_simulations_detail(
+                folders[:2] + [max(folders) + 1]))
+
+        sims = egta.get_simulations_detail(iter(folders), 2)
+        assert (await sims.__anext__())['folder_number'] in folders
+        await sims.aclose()
+        with pytest.raises(StopAsyncIteration):
+            await sims.__anext__()
+        await asyncio.sleep(0.1)
+        assert active[0] == 0
+
+
+@pytest.mark.asyncio
+async def test_simulation_job(mock_world_factory):
+    """Test looking up simulations by job id"""
+    world = mock_world_factory(roles=1, strategies=1, observations=3)
+    async with world.server as server:
+        async with server.api() as egta:
+            sims = {s['job']: s for s in await agather(
+                egta.get_simulations(prefetch=0))}
+
+        index = {}
+        async with server.api(job_index=index) as egta:
+            server.reset_requests()
+            assert await egta.get_simulation_job(2) == sims[2]
+            assert server.request_counts() == {('GET', 'simulation_all'): 1}
+            assert index == {2: sims[2]['folder']}
+
+            server.reset_requests()
+            assert await egta.get_simulation_job(2) == sims[2]
+            assert server.request_counts() == {('GET', 'simulation_get'): 1}
+
+            await agather(egta.get_simulations())
+            assert index == {job: sim['folder'] for job, sim in sims.items()}
+            index.clear()
+            await egta.get_simulation(sims[1]['folder'])
+            assert index == {1: sims[1]['folder']}
+
+            index[3] = sims[1]['folder']
+            server.reset_requests()
+            assert await egta.get_simulation_job(3) == sims[3]
+            assert server.request_count() == 2
+            assert index[3] == sims[3]['folder']
+
+            index[2] = len(sims) + 10
+            server.reset_requests()
+            assert await egta.get_simulation_job(2) == sims[2]
+            assert server.request_count() == 2
+            assert index[2] == sims[2]['folder']
+
+            with pytest.raises(ValueError):
+                await egta.get_simulation_job(4)
+
+
+async def next_event(events, timeout=5):
+    """Get the next event of a watcher"""
+    return await asyncio.wait_for(events.__anext__(), timeout)
+
+
+async def wait_until(cond, timeout=5):
+    """Wait until a condition holds"""
+    async def until():
+        """Poll the condition"""
+        while not cond():
+            await asyncio.sleep(0.001)
+    await asyncio.wait_for(until(), timeout)
+
+
+@pytest.mark.asyncio
+async def test_watch_simulations():
+    """Test watching simulations for state changes"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False, slots=2) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        sched = await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'sched', {'a': 2}, nodes=1))
+        server.add_profiles(sched['id'], ['a: 2 2'], 2)
+        await sched.add_profile('a: 2 1', 2)
+        sims = await agather(egta.get_simulations(column='folder', asc=True))
+        old = sims[-1]['folder']
+        assert sims[-1]['state'] == 'running'
+
+        server.reset_requests()
+        events = egta.watch_simulations(
+            min_interval=0.01, max_interval=0.05)
+        complete = egta.watch_simulations(
+            lambda e: e['state'] == 'complete', min_interval=0.01,
+            max_interval=0.05)
+        # Later simulations are new once the newest has been listed
+        await wait_until(
+            lambda: server.request_count(route='simulation_all') >= 1)
+        await sched.add_profile('a: 1 1, 1 2', 2)
+        new = [await next_event(events) for _ in range(2)]
+        assert [(e['old_state'], e['state']) for e in new] == [
+            (None, 'queued'), (None, 'queued')]
+        assert new[0]['folder'] < new[1]['folder']
+        assert all(e['profile'] == 'a: 1 1, 1 2' for e in new)
+
+        server.advance(15)
+        changes = {}
+        for _ in range(4):
+            event = await next_event(events)
+            changes[event['folder']] = event['old_state'], event['state']
+        assert changes == {
+            old - 1: ('running', 'complete'), old: ('running', 'complete'),
+            new[0]['folder']: ('queued', 'running'),
+            new[1]['folder']: ('queued', 'running')}
+        done = [await next_event(complete) for _ in range(2)]
+        assert {e['folder'] for e in done} == {old - 1, old}
+
+        await complete.aclose()
+        with pytest.raises(StopAsyncIteration):
+            await complete.__anext__()
+        server.advance(15)
+        done = [await next_event(events) for _ in range(2)]
+        assert {e['folder'] for e in done} == {e['folder'] for e in new}
+        assert all(isinstance(e['job'], int) for e in done)
+
+        # Polls without changes only list states
+        server.reset_requests()
+        await wait_until(
+            lambda: server.request_count(route='simulation_all') >= 20)
+        assert server.request_count(route='simulation_get') == 0
+
+    with pytest.raises(StopAsyncIteration):
+        await next_event(events)
+
+
+@pytest.mark.asyncio
+async def test_watch_simulations_start(monkeypatch):
+    """Test that changes while a watcher starts aren't lost"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        sched_id = server.create_scheduler(sim_id, 'sched', {'a': 2})
+        server.add_profiles(sched_id, ['a: 2 1'], 30)
+        sched = await egta.get_scheduler(sched_id)
+        await sched.add_profile('a: 2 2', 1)
+        running, = await agather(egta.get_simulations(
+            search='state="running"'))
+
+        # Finish the running simulation after the scan has seen it
+        anext = api._SimulationIterator.__anext__ # pylint: disable=protected-access
+
+        async def advancing(sims):
+            """Advance time after the first simulation"""
+            sim = await anext(sims)
+            if sim['folder'] == running['folder']:
+                server.advance(15)
+            return sim
+
+        monkeypatch.setattr(
+            api._SimulationIterator, '__anext__', advancing) # pylint: disable=protected-access
+        events = egta.watch_simulations(min_interval=0.01, max_interval=0.05)
+        event = await next_event(events)
+        assert event['folder'] == running['folder']
+        assert (event['old_state'], event['state']) == ('running', 'complete')
+        await events.aclose()
+
+
+@pytest.mark.asyncio
+async def test_watch_simulations_error():
+    """Test that polling errors end subscriptions"""
+    async with mockserver.server() as server, api.api('') as egta:
+        events = egta.watch_simulations(min_interval=0.01, max_interval=0.01)
+
+        def fail():
+            """Fail a request"""
+            raise ValueError('server down')
+
+        server.custom_response(fail)
+        with pytest.raises(ValueError, match='server down'):
+            await next_event(events)
+        with pytest.raises(StopAsyncIteration):
+            await next_event(events)
+
+
+@pytest.mark.asyncio
+async def test_wait_complete():
+    """Test waiting for schedulers to complete"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False, slots=1) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        scheds = [await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'sched{:d}'.format(i), {'a': 2})) for i in range(3)]
+        for sched, prof, count in [(scheds[2], 'a: 2 2', 2),
+                                   (scheds[0], 'a: 2 1', 3),
+                                   (scheds[1], 'a: 1 1, 1 2', 1)]:
+            await sched.add_profile(prof, count)
+
+        server.reset_requests()
+        done = egta.wait_all(
+            scheds + [scheds[0]], min_interval=0.1, max_interval=0.2)
+        waiter = asyncio.ensure_future(scheds[1].wait_complete(0.1, 0.2))
+        await wait_until(
+            lambda: server.request_count(route='scheduler_get') >= 3)
+        assert server.request_count(route='scheduler_get') == 3
+
+        for time, expected in [(25, [2]), (30, [0, 0]), (20, [1])]:
+            server.advance(time)
+            ids = [(await next_event(done))['id'] for _ in expected]
+            assert ids == [scheds[i]['id'] for i in expected]
+        reqs = await asyncio.wait_for(waiter, 5)
+        assert reqs['scheduling_requirements'][0]['current_count'] == 1
+        with pytest.raises(StopAsyncIteration):
+            await done.__anext__()
+
+
+@pytest.mark.asyncio
+async def test_wait_complete_consecutive(mock_world_factory):
+    """Test that a wait right after another finishes starts polling"""
+    world = mock_world_factory(roles=1, strategies=1)
+    async with world.server as server, server.api() as egta:
+        other_id = server.create_scheduler(world.sim_id, 'other', {'r0': 2})
+        scheds = [await egta.get_scheduler(sched_id) for sched_id
+                  in [world.sched_id, other_id, world.sched_id]]
+
+        async def consecutive():
+            """Wait on each scheduler without yielding in between"""
+            return [await sched.wait_complete(0.01, 0.01)
+                    for sched in scheds]
+
+        reqs = await asyncio.wait_for(consecutive(), 5)
+        assert [r['id'] for r in reqs] == [s['id'] for s in scheds]
+
+        # A poller that returned but hasn't been forgotten yet
+        finished = asyncio.ensure_future(asyncio.sleep(0))
+        await finished
+        egta._sess.waiter._task = finished # pylint: disable=protected-access
+        reqs = await asyncio.wait_for(scheds[1].wait_complete(0.01, 0.01), 5)
+        assert reqs['id'] == other_id
+
+
+@pytest.mark.asyncio
+async def test_wait_intervals():
+    """Test that polling intervals follow progress"""
+    wait = api._SchedulerWait(0, 1, 8, 1) # pylint: disable=protected-access
+    reqs = [{'current_count': 0, 'requirement': 4}]
+    for now, interval in [(0, 1), (1, 2), (3, 4), (7, 8), (15, 8)]:
+        wait.update(reqs, now)
+        assert wait.interval == interval
+        assert wait.due == now + interval
+    wait.update([{'current_count': 2, 'requirement': 4}], 23)
+    assert wait.interval == 4
+    wait.update([{'current_count': 3, 'requirement': 4}], 27)
+    assert wait.interval == 2
+
+
+@pytest.mark.asyncio
+async def test_wait_complete_backoff():
+    """Test that waits on inactive schedulers continue until cancelled"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        sched = await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'sched', {'a': 2}))
+        await sched.add_profile('a: 2 1', 1)
+        inactive = await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'inactive', {'a': 2}, active=False))
+        await inactive.add_profile('a: 2 2', 1)
+
+        waiter = egta._sess.waiter # pylint: disable=protected-access
+        server.reset_requests()
+        done = egta.wait_all([sched, inactive], 0.01, 0.16)
+        await wait_until(
+            lambda: server.request_count(route='scheduler_get') >= 6)
+        with pytest.raises(asyncio.TimeoutError):
+            await next_event(done, 0.01)
+        await done.aclose()
+        await wait_until(lambda: waiter._task is None) # pylint: disable=protected-access
+
+        server.reset_requests()
+        wait = asyncio.ensure_future(sched.wait_complete(0.01, 0.01))
+        await wait_until(
+            lambda: server.request_count(route='scheduler_get') >= 1)
+        wait.cancel()
+        # Cancelling the last wait stops polling
+        await wait_until(lambda: waiter._task is None) # pylint: disable=protected-access
+
+        await inactive.activate()
+        server.advance(15)
+        done = egta.wait_all([sched, inactive], 0.01, 0.01)
+        reqs = [await next_event(done) for _ in range(2)]
+        assert {r['id'] for r in reqs} == {sched['id'], inactive['id']}
+        assert all(r['active'] for r in reqs)
+
+
+@pytest.mark.asyncio
+async def test_scheduler_progress():
+    """Test tracking scheduler progress"""
+    async with mockserver.server(
+            virtual_time=True, auto_advance=False, slots=1) as server, \
+            api.api('') as egta:
+        sim_id = server.create_simulator(
+            'sim', '1', delay_dist=lambda: 10, role_conf={'a': ['1', '2']})
+        sched = await egta.get_scheduler(server.create_scheduler(
+            sim_id, 'sched', {'a': 2}))
+        await sched.add_profile('a: 2 1', 3)
+        await sched.add_profile('a: 2 2', 1)
+
+        progress = sched.get_progress(0.01, 0.5)
+        prog = await next_event(progress)
+        assert prog == {
+            'id': sched['id'], 'active': True, 'completed': 0, 'required': 4,
+            'fraction': 0, 'throughput': None, 'eta': None, 'complete': False}
+
+        server.advance(15)
+        prog = await next_event(progress)
+        assert prog['completed'] == 1
+        assert prog['fraction'] == 0.25
+        assert prog['throughput'] > 0
+        assert prog['eta'] == pytest.approx(3 / prog['throughput'])
+        first = prog['throughput']
+
+        prog = await next_event(progress)
+        assert prog['completed'] == 1
+        assert prog['throughput'] == pytest.approx(first / 2)
+        assert prog['eta'] == pytest.approx(3 / prog['throughput'])
+
+        server.advance(30)
+        prog = await next_event(progress)
+        assert prog['completed'] == 4
+        assert prog['eta'] == 0
+        assert prog['complete']
+        with pytest.raises(StopAsyncIteration):
+            await progress.__anext__()
+
+        await sched.deactivate()
+        await sched.add_profile('a: 1 1, 1 2', 1)
+        progress = sched.get_progress()
+        prog = await next_event(progress)
+        assert prog['completed'] == 4
+        assert prog['required'] == 5
+        assert not prog['active']
+        assert not prog['complete']
+        await progress.aclose()
+        with pytest.raises(StopAsyncIteration):
+            await progress.__anext__()
+
+
+def test_progress_eta():
+    """Test that eta is only estimated from positive throughput"""
+    tracker = api._ProgressTracker(1) # pylint: disable=protected-access
+
+    def reqs(*counts):
+        """Requirements with a current count for each profile"""
+        return {'id': 0, 'active': True, 'scheduling_requirements': [
+            {'current_count': count, 'requirement': req}
+            for count, req in counts]}
+
+    assert tracker.update(reqs((2, 4), (0, 2)), 0)['eta'] is None
+    prog = tracker.update(reqs((2, 4), (1, 2)), 1)
+    assert prog['throughput'] == 1
+    assert prog['eta'] == 3
+    prog = tracker.update(reqs((1, 1), (1, 2)), 2)
+    assert prog['throughput'] == -1
+    assert prog['eta'] is None
+    prog = tracker.update(reqs((1, 1), (1, 2)), 3)
+    assert prog['throughput'] == 0
+    assert prog['eta'] is None
+    prog = tracker.update(reqs((1, 1), (1, 1)), 4)
+    assert prog['eta'] == 0
+
+
+@pytest.mark.asyncio
+async def test_requirements_all():
+    """Test getting requirements of several schedulers"""
+    async with mockserver.server() as server, api.api('') as egta:
+        sim_id = server.create_simulator('sim', '1', role_conf={'a': ['1']})
+        scheds = []
+        active = [0, 0]
+        for i in range(6):
+            sched = await egta.get_scheduler(server.create_scheduler(
+                sim_id, 'sched{:d}'.format(i), {'a': 2}))
+
+            async def get_requirements(fetch=sched.get_requirements):
+                """Get requirements and track the number fetching"""
+                active[0] += 1
+                active[1] = max(active)
+                try:
+                    return await fetch()
+                finally:
+                    active[0] -= 1
+
+            sched.get_requirements = get_requirements
+            scheds.append(sched)
+
+        cache = {}
+        server.reset_requests()
+        reqs = await agather(egta.get_requirements_all(scheds, 2, cache))
+        assert sorted(r['id'] for r in reqs) == [s['id'] for s in scheds]
+        assert active == [0, 2]
+        assert set(cache) == {s['id'] for s in scheds}
+        assert server.request_count(route='scheduler_get') == 6
+
+        del cache[scheds[0]['id']]
+        reqs = await agather(egta.get_requirements_all(scheds, 2, cache))
+        assert len(reqs) == 6
+        assert server.request_count(route='scheduler_get') == 7
+
+
+@pytest.mark.parametrize('html', [
+    '<html><body></body></html>',
+    '<html><body><table><tbody></tbody></table></body></html>',
+    '<table><tbody><tr><td>a</td><td> b <i>c</i>d </td></tr>\n'
+    '<tr><th>1</th>x<td>&amp; &lt;2&gt;</td><td></td></tr>\n'
+    '<div>skipped</div><tr><td>N/A<br>3</td></tr></tbody></table>'
+    '<table><tbody><tr><td>later</td></tr></tbody></table>',
+    '<tbody><tr><td>unclosed<td>cells<tr><td>rows</tbody>',
+    '<div class="show_for simulation">text<p>State: <b>run</b>ning</p>'
+    '<span>not a p</span><p>Folder: 7</p>tail</div><p>Job: 3</p>',
+    '<div class="other"><p>Folder: 7</p></div>',
+])
+def test_row_extractor(html):
+    """Test that extracted rows match xpath on the parsed tree"""
+    tree = etree.HTML(html)
+    tbody = tree.xpath('(//tbody)[1]/tr')
+    info = tree.xpath('(//div[@class="show_for simulation"])[1]/p')
+    rows = api._RowExtractor( # pylint: disable=protected-access
+        lambda tag, _: tag == 'tbody', 'tr', True)
+    parser = etree.HTMLParser(target=rows)
+    for i in range(0, len(html), 7):
+        parser.feed(html[i:i + 7].encode())
+    assert parser.close() == [
+        tuple(''.join(e.itertext()) for e in row) for row in tbody]
+
+    rows = api._RowExtractor( # pylint: disable=protected-access
+        lambda tag, attrib: attrib.get('class') == 'show_for simulation',
+        'p', False)
+    assert etree.fromstring(html, etree.HTMLParser(target=rows)) == [
+        ''.join(e.itertext()) for e in info]
+
+
+@pytest.mark.asyncio
+async def test_streamed_rows(monkeypatch, mock_world_factory):
+    """Test that simulation pages are streamed, read and closed"""
+    responses = []
+    closed = []
+    request = requests.Session.request
+    close = requests.Response.close
+
+    def recorded(sess, verb, url, **kwargs):
+        """Record simulation page responses"""
+        resp = request(sess, verb, url, **kwargs)
+        if '/simulations' in url:
+            responses.append((kwargs.get('stream'), resp))
+        return resp
+
+    def recorded_close(resp):
+        """Record closed responses"""
+        closed.append(resp)
+        close(resp)
+
+    monkeypatch.setattr(requests.Session, 'request', recorded)
+    monkeypatch.setattr(requests.Response, 'close', recorded_close)
+    world = mock_world_factory(roles=1, strategies=1)
+    async with world.server as server, server.api() as egta:
+        sim, = await agather(egta.get_simulations())
+        info = await egta.get_simulation(sim['folder'])
+        assert info['folder_number'] == sim['folder']
+    assert len(responses) == 3
+    assert all(stream and resp in closed and not resp.raw.read()
+               for stream, resp in responses)
 
 
 @pytest.mark.asyncio
@@ -876,3 +1953,55 @@ async def test_threading():
         await asyncio.gather(*[
             sim.add_strategies({'r{:d}'.format(i): ['s{:d}'.format(i)]})
             for i in range(10)])
+
+
+@pytest.mark.asyncio
+async def test_concurrent_reads():
+    """Test that reads share the lock and concurrent writes stay consistent"""
+    with futures.ThreadPoolExecutor(8) as executor:
+        async with mockserver.server(scoped=True) as server, \
+                server.api(executor=executor) as egta:
+            sim = await create_simulator(server, egta, 'sim', '1')
+            sched = await sim.create_generic_scheduler(
+                'sched', True, 0, 4, 0, 0)
+            await sched.add_roles({'a': 2, 'b': 2})
+            await sched.add_profile('a: 2 1; b: 2 5', 2)
+            await sched_complete(sched)
+
+            lock = server._data.lock # pylint: disable=protected-access
+            read = lock.read
+            count_lock = threading.Lock()
+            held = threading.Event()
+            readers = [0, 0]
+
+            @contextlib.contextmanager
+            def counted_read():
+                """Hold the read lock until another reader holds it too"""
+                with read():
+                    with count_lock:
+                        readers[0] += 1
+                        readers[1] = max(readers)
+                        if readers[0] > 1:
+                            held.set()
+                    held.wait(5)
+                    try:
+                        yield
+                    finally:
+                        with count_lock:
+                            readers[0] -= 1
+
+            lock.read = counted_read
+            await asyncio.gather(*(sched.get_requirements() for _ in range(8)))
+            del lock.read
+            assert readers[0] == 0 and readers[1] >= 2
+
+            results = await asyncio.gather(*itertools.chain(
+                (sched.get_requirements() for _ in range(20)),
+                (sched.add_profile('a: 1 1, 1 2; b: 2 {:d}'.format(i), 1)
+                 for i in range(5, 8))))
+            for reqs in results[:20]:
+                assert 1 <= len(reqs['scheduling_requirements']) <= 4
+            await sched_complete(sched)
+            reqs = await sched.get_requirements()
+            assert len(reqs['scheduling_requirements']) == 4
+            assert len(await agather(egta.get_simulations())) == 5
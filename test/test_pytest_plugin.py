@@ -0,0 +1,84 @@
+"""Test the pytest plugin"""
+import pytest
+
+from egtaonline import api
+from egtaonline import pytest_plugin
+
+
+def test_world_assignments():
+    """Test that world assignments are complete and unique"""
+    assigns = pytest_plugin.world_assignments(2, 3, 2)
+    assert len(assigns) == len(set(assigns)) == 36
+    assert assigns[0] == 'r0: 2 s0; r1: 2 s0'
+    assert assigns[1] == 'r0: 2 s0; r1: 1 s0, 1 s1'
+
+
+@pytest.mark.asyncio
+async def test_mock_world(mock_world):
+    """Test the default world"""
+    async with mock_world.server as server, server.api() as egta:
+        assert len(mock_world.profile_ids) == 36
+        game = await egta.get_game(mock_world.game_id)
+        summ = await game.get_summary()
+        assert len(summ['profiles']) == 36
+        assert all(p['observations_count'] == 1 for p in summ['profiles'])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize('mock_world', [
+    {'roles': 1, 'strategies': 4, 'players': 3, 'observations': 2},
+    {'roles': 3, 'strategies': 2, 'profiles': 5},
+], indirect=True)
+async def test_mock_world_params(mock_world):
+    """Test parametrized worlds"""
+    async with mock_world.server as server, server.api() as egta:
+        sched = await egta.get_scheduler(mock_world.sched_id)
+        reqs = (await sched.get_requirements())['scheduling_requirements']
+        assert sorted(r['id'] for r in reqs) == mock_world.profile_ids
+
+
+@pytest.mark.asyncio
+async def test_mock_world_copies(mock_world_factory):
+    """Test that worlds are independent copies"""
+    first = mock_world_factory(observations=2)
+    second = mock_world_factory(observations=2)
+    async with first.server as server, server.api() as egta:
+        game = await egta.get_game(first.game_id)
+        await game.remove_strategy('r0', 's0')
+        first_summ = await game.get_summary()
+        first_prof = await egta.get_profile(first.profile_ids[0])
+        first_full = await first_prof.get_full_data()
+
+    async with second.server as server, server.api() as egta:
+        game = await egta.get_game(second.game_id)
+        assert len((await game.get_summary())['profiles']) > len(
+            first_summ['profiles'])
+        prof = await egta.get_profile(second.profile_ids[0])
+        assert await prof.get_full_data() == first_full
+
+
+@pytest.mark.asyncio
+async def test_mock_world_server_kwargs(mock_world_factory):
+    """Test passing server options to worlds"""
+    world = mock_world_factory(
+        {'virtual_time': True, 'auto_advance': False}, profiles=1)
+    async with world.server as server, server.api() as egta:
+        sched = await egta.get_scheduler(world.sched_id)
+        prof_id, = world.profile_ids
+        await sched.remove_profile(prof_id)
+        prof = await egta.get_profile(prof_id)
+        await sched.add_profile(prof['assignment'], 3)
+        server.advance(1)
+        prof = await egta.get_profile(prof_id)
+        assert prof['observations_count'] == 3
+
+
+@pytest.mark.asyncio
+async def test_mock_world_unscoped(mock_world_factory):
+    """Test that unscoped worlds serve default apis"""
+    world = mock_world_factory({'scoped': False}, roles=1, strategies=1)
+    async with world.server:
+        async with api.api() as egta:
+            sched = await egta.get_scheduler(world.sched_id)
+            reqs = (await sched.get_requirements())['scheduling_requirements']
+            assert [r['id'] for r in reqs] == world.profile_ids